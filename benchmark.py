@@ -0,0 +1,228 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import gymnasium as gym
+import numpy as np
+import traffic_control_game
+from traffic_control_game.envs import TrafficControlShardedEnv
+
+
+# Benchmark of the Traffic Control environment: environment steps per second and car-frames per second
+# (cars on the screen summed over the simulated frames) over a matrix of settings.
+# Every repeat of a case runs the same episodes (fixed seeds), so that the spread only comes from timing noise.
+#
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --baseline baseline.json       # exit code 1 if a case is slower than the baseline
+
+# probability of generation for each lane, the east-west axis doubling the north-south one as in main.py
+DEMANDS = {"very_low": [0.005, 0.01, 0.005, 0.01], "low": [0.03, 0.0625, 0.03, 0.0625],
+           "high": [0.06, 0.125, 0.06, 0.125]}
+ENV_STEPS = [50, 150]
+N_STATES = [2, 4]
+# headless (array-based game) or offscreen rendering (sprites, a frame drawn after each step)
+RENDER_MODES = [None, "rgb_array"]
+# fixed cycle of main.py, or uniformly random actions (that can cause crashes, ending episodes early)
+POLICIES = ["cycle", "random"]
+ACTIONS_LOOP = [0]*2 + [1]
+# headless cases are also run with fast-forward, whose gain depends on the demand (see README, Fast-forward)
+FAST_FORWARD = [False, True]
+# networks of intersections (rows, cols of a grid), simulated in a single process or sharded across worker
+# processes (one per core, exchanging the cars crossing the shards once per action)
+NETWORKS = {"grid4x4": (4, 4)}
+NETWORK_ENVS = ["network", "sharded"]
+NETWORK_ENV_STEPS = 50
+
+
+def cases():
+    """ Matrix of settings of the benchmark
+
+    Returns:
+        list of dict: settings of each case, with its name
+    """
+    matrix = []
+    for demand, env_steps, n_states, render_mode, policy, fast_forward in itertools.product(
+            DEMANDS, ENV_STEPS, N_STATES, RENDER_MODES, POLICIES, FAST_FORWARD):
+        # fast-forward is disabled with rendering
+        if fast_forward and render_mode is not None:
+            continue
+        name = f"demand={demand},env_steps={env_steps},n_states={n_states},render={render_mode},policy={policy}"
+        # names of the frame-by-frame cases are unchanged, for the comparison with older baselines
+        if fast_forward:
+            name += ",fast_forward=True"
+        matrix.append({"name": name, "env": "single", "demand": demand, "env_steps": env_steps,
+                       "n_states": n_states, "render_mode": render_mode, "policy": policy,
+                       "fast_forward": fast_forward})
+    for network, env, demand, policy in itertools.product(NETWORKS, NETWORK_ENVS, DEMANDS, POLICIES):
+        name = f"network={network},env={env},demand={demand},env_steps={NETWORK_ENV_STEPS},policy={policy}"
+        matrix.append({"name": name, "env": env, "network": network, "demand": demand,
+                       "env_steps": NETWORK_ENV_STEPS, "n_states": 4, "render_mode": None, "policy": policy,
+                       "fast_forward": False})
+    return matrix
+
+
+def make_env(case, perf_stats=False):
+    """ Environment of a case
+
+    Args:
+        case (dict): settings, see cases()
+        perf_stats (bool, optional): enables the timings of the environment (single intersection only).
+                                     Defaults to False.
+
+    Returns:
+        gym.Env: environment, not reset
+    """
+    env_info = {"ps": DEMANDS[case["demand"]], "max_wait_time": 25, "env_steps": case["env_steps"],
+                "n_states": case["n_states"], "fast_forward": case["fast_forward"], "perf_stats": perf_stats}
+    if case["env"] == "single":
+        return gym.make("traffic_control-v0", env_info=env_info, render_mode=case["render_mode"])
+    env_info["network"] = NETWORKS[case["network"]]
+    if case["env"] == "sharded":
+        return TrafficControlShardedEnv(env_info)
+    return gym.make("traffic_control_network-v0", env_info=env_info)
+
+
+def run(case, steps, seed, perf_stats=False):
+    """ Runs steps of the environment with the settings of a case, resetting it when an episode ends
+
+    Args:
+        case (dict): settings, see cases()
+        steps (int): number of environment steps
+        seed (int): seed of the first episode (and of the random policy)
+        perf_stats (bool, optional): enables the timings of the environment. Defaults to False.
+
+    Returns:
+        float: elapsed time in seconds
+        gym.Env: environment, after the last step
+    """
+    env = make_env(case, perf_stats)
+    env.action_space.seed(seed)
+    env.reset(seed=seed)
+    episode = 0
+    start = time.perf_counter()
+    for i in range(steps):
+        if case["policy"] == "cycle":
+            # same phase at every junction of a network
+            action = np.full(env.action_space.shape, ACTIONS_LOOP[i % len(ACTIONS_LOOP)])
+            action = action if action.ndim > 0 else int(action)
+        else:
+            action = env.action_space.sample()
+        _, _, terminated, truncated, _ = env.step(action)
+        if case["render_mode"] is not None:
+            env.render()
+        if terminated or truncated:
+            episode += 1
+            env.reset(seed=seed + episode)
+    elapsed = time.perf_counter() - start
+    # stops the workers of sharded environments
+    env.close()
+    return elapsed, env
+
+
+def summary(values):
+    """ Robust statistics of repeated measures
+
+    Args:
+        values (list of float): measures
+
+    Returns:
+        dict: median, interquartile range and all the measures
+    """
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    return {"median": float(median), "iqr": float(q3 - q1), "runs": [float(value) for value in values]}
+
+
+def benchmark(matrix, steps, repeats, seed):
+    """ Measures the throughput of each case of the matrix
+
+    Args:
+        matrix (list of dict): settings of the cases
+        steps (int): number of environment steps of each run
+        repeats (int): number of timed runs of each case
+        seed (int): seed of the runs
+
+    Returns:
+        list of dict: settings and statistics of each case
+    """
+    results = []
+    for case in matrix:
+        # runs are deterministic: the number of car-frames is counted once, in an instrumented run (not timed).
+        # Networks have no performance statistics, only their steps per second are measured
+        counts = None
+        if case["env"] == "single":
+            _, env = run(case, steps, seed, perf_stats=True)
+            counts = env.unwrapped.perf_stats()["total"]
+        times = [run(case, steps, seed)[0] for _ in range(repeats)]
+        results.append({**case, "steps": steps, "steps_per_sec": summary([steps/elapsed for elapsed in times])})
+        message = (f"{case['name']}: {results[-1]['steps_per_sec']['median']:.1f} steps/s "
+                   f"(IQR {results[-1]['steps_per_sec']['iqr']:.1f})")
+        if counts is not None:
+            results[-1].update({"frames": counts["frames"], "car_frames": counts["car_frames"],
+                                "car_frames_per_sec": summary([counts["car_frames"]/elapsed for elapsed in times])})
+            message += f", {results[-1]['car_frames_per_sec']['median']:.0f} car-frames/s"
+        print(message, file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Compares the median throughputs with the ones of a baseline
+
+    Args:
+        results (list of dict): results of benchmark()
+        baseline (dict): output of a previous run
+        tolerance (float): relative slowdown above which a case is reported as a regression
+
+    Returns:
+        list of dict: name, baseline and current median steps/sec, ratio and regression flag of the common cases
+    """
+    previous = {result["name"]: result for result in baseline["results"]}
+    diff = []
+    for result in results:
+        if result["name"] not in previous:
+            continue
+        old = previous[result["name"]]["steps_per_sec"]["median"]
+        new = result["steps_per_sec"]["median"]
+        diff.append({"name": result["name"], "baseline": old, "current": new, "ratio": new/old,
+                     "regression": new < (1 - tolerance)*old})
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the Traffic Control environment")
+    parser.add_argument("--steps", type=int, default=50, help="environment steps of each run")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs of each case")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the episodes and of the random policy")
+    parser.add_argument("--only", default="", help="only runs the cases whose name contains this string")
+    parser.add_argument("--output", help="file in which the results are written (JSON), default stdout")
+    parser.add_argument("--baseline", help="results of a previous run (JSON) to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    # offscreen rendering does not need a display
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    matrix = [case for case in cases() if args.only in case["name"]]
+    output = {"meta": {"python": platform.python_version(), "numpy": np.__version__, "gymnasium": gym.__version__,
+                       "platform": platform.platform(), "processor": platform.processor(),
+                       "steps": args.steps, "repeats": args.repeats, "seed": args.seed},
+              "results": benchmark(matrix, args.steps, args.repeats, args.seed)}
+    if args.baseline:
+        with open(args.baseline) as file:
+            output["comparison"] = compare(output["results"], json.load(file), args.tolerance)
+        for case in output["comparison"]:
+            flag = "REGRESSION" if case["regression"] else "ok"
+            print(f"{flag:>10} {case['ratio']:6.2f}x {case['name']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(output, file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+    if args.baseline and any(case["regression"] for case in output["comparison"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
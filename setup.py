@@ -5,8 +5,10 @@ setuptools.setup(name='TrafficControl',
       author='Oskar G. & Nicolò G.',
       description='Implementation of OpenAI Gym for traffic control',
       install_requires=['gymnasium==0.27.1', 'numpy==1.24.2'],  # And any other dependencies
+      extras_require={'jit': ['numba']},  # compiled kernel of the lanes (optional)
       url="https://github.com/oskargirardin/traffic_control",
       packages=setuptools.find_packages(),
+      package_data={'traffic_control_game': ['img/*.png']},
       python_requires=">=3.6",
       classifiers=[
         "Programming Language :: Python :: 3",
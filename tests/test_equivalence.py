@@ -0,0 +1,107 @@
+import copy
+import os
+import numpy as np
+import pytest
+from traffic_control_game.envs import (TrafficControlEnv, TrafficControlVectorEnv, TrafficControlNetworkEnv,
+                                       TrafficControlShardedEnv)
+from traffic_control_game.envs.headless import advance_lanes, lane_kernel
+from traffic_control_game.envs.logic import NUDGES
+
+# offscreen rendering of the sprite game does not need a display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+ENV_INFO = {"ps": [0.06, 0.125, 0.06, 0.125], "env_steps": 50, "max_wait_time": 400, "flat_obs": True}
+SEEDS = [0, 1, 2]
+STEPS = 12
+
+
+def actions(seed, shape=()):
+    """ Random actions (that can cause crashes) of the given shape, the same for a given seed
+    """
+    rng = np.random.default_rng(seed)
+    return [rng.integers(4, size=shape) for _ in range(STEPS)]
+
+
+def rollout(env, seed, shape=()):
+    """ Observations, rewards, terminations and scores of the steps of an episode, until it ends
+    """
+    env.reset(seed=seed)
+    out = []
+    for action in actions(seed, shape):
+        observation, reward, terminated, _, info = env.step(action if shape else int(action))
+        out.append((np.asarray(observation).tolist(), reward, terminated, info["score"]))
+        if terminated:
+            break
+    return out
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_headless_equals_sprites(seed):
+    headless = rollout(TrafficControlEnv(ENV_INFO), seed)
+    env = TrafficControlEnv(ENV_INFO, render_mode="rgb_array")
+    assert rollout(env, seed) == headless
+    env.close()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("ps", [[0.005, 0.01, 0.005, 0.01], [0.06, 0.125, 0.06, 0.125]])
+def test_fast_forward_equals_frame_by_frame(seed, ps):
+    env_info = {**ENV_INFO, "ps": ps, "env_steps": 150}
+    expected = rollout(TrafficControlEnv(env_info), seed)
+    assert rollout(TrafficControlEnv({**env_info, "fast_forward": True}), seed) == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_vector_equals_single(seed):
+    num_envs = 3
+    vector = TrafficControlVectorEnv(num_envs, ENV_INFO)
+    vector.reset(seed=seed)
+    singles = [TrafficControlEnv(ENV_INFO) for _ in range(num_envs)]
+    for single in singles:
+        single.reset(seed=seed)
+    running = np.ones(num_envs, dtype=bool)
+    for action in actions(seed, num_envs):
+        # arrivals the vector environment is about to draw, given to each single environment
+        rng = copy.deepcopy(vector._np_random)
+        arrivals = rng.random((vector.env_steps, num_envs, len(vector.dirs))) < vector.ps
+        sides = rng.integers(len(NUDGES), size=arrivals.shape)
+        observation, reward, terminated, _, infos = vector.step(action)
+        for i in np.flatnonzero(running):
+            singles[i]._draw_arrivals = lambda i=i: (arrivals[:, i], sides[:, i], np.zeros_like(sides[:, i]))
+            single_observation, single_reward, single_terminated, _, _ = singles[i].step(int(action[i]))
+            # finished intersections are reset automatically, their last observation is in the info
+            final = infos["final_observation"][i] if terminated[i] else observation[i]
+            assert (np.asarray(final).tolist(), reward[i], terminated[i]) == \
+                   (single_observation.tolist(), single_reward, single_terminated)
+        running &= ~terminated
+        if not running.any():
+            break
+
+
+@pytest.mark.parametrize("kernel", ["python", "numba"])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_lane_kernel_equals_numpy(kernel, seed):
+    if kernel == "numba":
+        pytest.importorskip("numba")
+    expected = TrafficControlVectorEnv(4, {**ENV_INFO, "jit": False})
+    env = TrafficControlVectorEnv(4, ENV_INFO)
+    env.game.jit = False
+    env.game.kernel = advance_lanes if kernel == "python" else lane_kernel()
+    expected.reset(seed=seed)
+    env.reset(seed=seed)
+    for action in actions(seed, 4):
+        observation, reward, terminated, _, info = env.step(action)
+        expected_observation, expected_reward, expected_terminated, _, expected_info = expected.step(action)
+        assert (observation == expected_observation).all() and (reward == expected_reward).all()
+        assert (terminated == expected_terminated).all() and (info["score"] == expected_info["score"]).all()
+
+
+@pytest.mark.parametrize("seed", SEEDS[:2])
+def test_sharded_equals_network(seed):
+    env_info = {**ENV_INFO, "network": (2, 2)}
+    expected = rollout(TrafficControlNetworkEnv(env_info), seed, 4)
+    env = TrafficControlShardedEnv({**env_info, "n_workers": 2, "exchange_frames": 1})
+    try:
+        assert rollout(env, seed, 4) == expected
+    finally:
+        env.close()
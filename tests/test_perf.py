@@ -0,0 +1,45 @@
+import os
+import pytest
+from traffic_control_game.envs import TrafficControlEnv
+from traffic_control_game.envs.perf import PerfStats
+
+# offscreen rendering of the sprite game does not need a display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+ENV_INFO = {"ps": [0.06, 0.125, 0.06, 0.125], "env_steps": 50, "max_wait_time": 400, "perf_stats": True}
+STEPS = 5
+
+
+@pytest.mark.parametrize("render_mode", [None, "rgb_array"])
+def test_perf_stats_counts_frames_and_stages(render_mode):
+    env = TrafficControlEnv(ENV_INFO, render_mode=render_mode)
+    env.reset(seed=0)
+    frames = car_frames = 0
+    for _ in range(STEPS):
+        # same phase at each step: no yellow lights, every step simulates env_steps frames
+        _, _, terminated, _, info = env.step(0)
+        assert not terminated
+        step = info["perf"]
+        assert set(step) == set(PerfStats.STAGES + PerfStats.COUNTS)
+        assert step["steps"] == 1 and step["frames"] >= ENV_INFO["env_steps"]
+        assert 0 < step["car_frames"] <= step["frames"]*env.game.number_cars
+        frames += step["frames"]
+        car_frames += step["car_frames"]
+    assert step["frames"] == ENV_INFO["env_steps"]
+
+    # totals cumulate the steps, each stage of the steps is timed
+    total = env.perf_stats()["total"]
+    assert set(total) == set(PerfStats.STAGES + PerfStats.COUNTS)
+    assert (total["steps"], total["frames"], total["car_frames"]) == (STEPS, frames, car_frames)
+    for stage in ["update_waiting", "arrivals", "add_car", "move_cars", "check_lights", "stop_behind_car",
+                  "update_score", "get_obs", "check_crash"]:
+        assert total[stage] > 0, stage
+
+
+def test_perf_stats_disabled():
+    env = TrafficControlEnv({**ENV_INFO, "perf_stats": False})
+    env.reset(seed=0)
+    _, _, _, _, info = env.step(0)
+    assert "perf" not in info
+    with pytest.raises(AssertionError):
+        env.perf_stats()
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pygame
+import pytest
+from traffic_control_game.envs import TrafficControlEnv
+from traffic_control_game.envs.draw import Renderer, draw_all
+from traffic_control_game.envs.logic import Setup
+
+# the human window is opened on a display that does not need a screen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+ENV_INFO = {"ps": [0.06, 0.125, 0.06, 0.125], "env_steps": 5, "max_wait_time": 400}
+STEPS = 40
+
+
+def pixels(surface):
+    """ Pixels of a surface, as an array of shape (width, height, 3)
+    """
+    return pygame.surfarray.array3d(surface)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_renderer_equals_full_redraw(seed):
+    env = TrafficControlEnv(ENV_INFO, render_mode="rgb_array")
+    env.reset(seed=seed)
+    rng = np.random.default_rng(seed)
+    renderer = Renderer()
+    display = pygame.Surface((Setup.WIDTH, Setup.HEIGHT))
+    expected = pygame.Surface((Setup.WIDTH, Setup.HEIGHT))
+    for _ in range(STEPS):
+        _, _, terminated, _, _ = env.step(int(rng.integers(4)))
+        if terminated:
+            break
+        yellows = [env.dirs[i] for i in np.flatnonzero(rng.random(len(env.dirs)) < 0.2)]
+        before = pixels(display)
+        areas = renderer.draw(display, env.game, yellows)
+        draw_all(expected, env.game.lights_dict, env.game.score, env.game.number_cars, yellows)
+        env.game.draw_cars(expected)
+        after = pixels(display)
+        assert (after == pixels(expected)).all()
+
+        # the pixels that changed are in the areas to update on the screen
+        dirty = np.zeros(after.shape[:2], dtype=bool)
+        for rect in areas:
+            rect = rect.clip(display.get_rect())
+            dirty[rect.left:rect.right, rect.top:rect.bottom] = True
+        assert not (before != after).any(axis=2)[~dirty].any()
+    env.close()
+
+
+@pytest.mark.parametrize("render_every", [1, 7])
+def test_human_draws_every_render_every_frames(render_every, monkeypatch):
+    draws = []
+    update = pygame.display.update
+    monkeypatch.setattr(pygame.display, "update", lambda *args: draws.append(1) or update(*args))
+    env_info = {**ENV_INFO, "env_steps": 50, "render_every": render_every}
+    env = TrafficControlEnv(env_info, render_mode="human")
+    try:
+        env.reset(seed=0)
+        assert len(draws) == 1
+        # same phase at each step (no yellow lights): every step simulates env_steps frames
+        steps = 3
+        for _ in range(steps):
+            _, _, terminated, _, _ = env.step(env.previous_action)
+            assert not terminated
+        assert len(draws) == 1 + steps*env_info["env_steps"] // render_every
+    finally:
+        env.close()
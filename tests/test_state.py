@@ -0,0 +1,46 @@
+import pytest
+from traffic_control_game.envs import TrafficControlEnv
+
+
+ENV_INFO = {"ps": [0.03, 0.0625, 0.03, 0.0625], "env_steps": 150, "max_wait_time": 1500}
+ACTIONS = [0, 0, 1]*4
+
+
+def rollout(env, actions):
+    """ Observations, rewards and scores of the steps of the given actions
+    """
+    out = []
+    for action in actions:
+        observation, reward, terminated, _, info = env.step(action)
+        out.append((observation, reward, terminated, info["score"]))
+    return out
+
+
+@pytest.mark.parametrize("options", [{}, {"demand": (0.9, 600, 0, 1)}, {"ps": [0.06, 0.02, 0.06, 0.02]}])
+def test_set_state_replays_episode(options):
+    env = TrafficControlEnv(ENV_INFO)
+    env.reset(seed=0, options=options)
+    rollout(env, ACTIONS[:3])
+    state = env.get_state()
+    expected = rollout(env, ACTIONS)
+
+    # same environment, then a new one reset with another demand
+    env.set_state(state)
+    assert rollout(env, ACTIONS) == expected
+    other = TrafficControlEnv(ENV_INFO)
+    other.reset(seed=1)
+    other.set_state(state)
+    assert rollout(other, ACTIONS) == expected
+
+
+def test_demand_as_list():
+    env = TrafficControlEnv(ENV_INFO)
+    observation, _ = env.reset(seed=0, options={"demand": [0.9, 600, 0, 1]})
+    expected = TrafficControlEnv(ENV_INFO)
+    expected.reset(seed=0, options={"demand": (0.9, 600, 0, 1)})
+    assert rollout(env, ACTIONS) == rollout(expected, ACTIONS)
+
+
+def test_invalid_demand():
+    with pytest.raises(ValueError):
+        TrafficControlEnv(ENV_INFO).reset(seed=0, options={"demand": [0.9, 600]})
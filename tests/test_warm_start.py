@@ -0,0 +1,40 @@
+import os
+from traffic_control_game.envs import TrafficControlEnv
+from traffic_control_game.envs import TrafficControl
+
+
+ENV_INFO = {"ps": [0.03, 0.0625, 0.03, 0.0625], "env_steps": 150, "max_wait_time": 1500, "flat_obs": True,
+            "warm_start": 4, "warm_start_steps": 3}
+ACTIONS = [0, 0, 1]*2
+SEEDS = range(4)
+
+
+def rollouts(env):
+    """ Reset observations and observations, rewards and scores of the steps of an episode, for each seed
+    """
+    out = []
+    for seed in SEEDS:
+        observation, _ = env.reset(seed=seed)
+        out.append(observation.tolist())
+        for action in ACTIONS:
+            observation, reward, terminated, _, info = env.step(action)
+            out.append((observation.tolist(), reward, terminated, info["score"]))
+    return out
+
+
+def test_warm_start_cache_round_trip(tmp_path, monkeypatch):
+    env_info = {**ENV_INFO, "warm_start_cache": str(tmp_path)}
+    # pool simulated by the first environment and stored in the cache
+    monkeypatch.setattr(TrafficControl, "WARM_STATES", {})
+    expected = rollouts(TrafficControlEnv(env_info))
+    assert len(os.listdir(tmp_path)) == 1
+
+    # pool loaded from the cache by a new environment (nothing kept in memory)
+    monkeypatch.setattr(TrafficControl, "WARM_STATES", {})
+    env = TrafficControlEnv(env_info)
+    assert rollouts(env) == expected
+    assert len(TrafficControl.WARM_STATES) == 1
+
+    # episodes start from the states of the pool, not from empty roads
+    empty = [env.reset(seed=seed, options={"warm_start": False})[0].tolist() for seed in SEEDS]
+    assert expected[::len(ACTIONS) + 1] != empty
@@ -5,3 +5,8 @@ register(
     id='traffic_control-v0',
     entry_point='traffic_control_game.envs:TrafficControlEnv'
 )
+
+register(
+    id='traffic_control_network-v0',
+    entry_point='traffic_control_game.envs:TrafficControlNetworkEnv'
+)
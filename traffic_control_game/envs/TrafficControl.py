@@ -1,4 +1,3 @@
-
 import gymnasium as gym
 from gymnasium import spaces
 import pygame
@@ -6,8 +5,20 @@ import numpy as np
 import os
 import time
 import sys
+import hashlib
+import pickle
+from collections import namedtuple
 from traffic_control_game.envs.draw import *
 from traffic_control_game.envs.logic import *
+from traffic_control_game.envs.headless import HeadlessGame
+from traffic_control_game.envs.perf import PerfStats
+
+# state of the environment (see TrafficControlEnv.get_state): state of the game, previous action, state of the
+# generator drawing the arrivals and demand of the episode (frames since the reset, probabilities and multiplier)
+EnvState = namedtuple("EnvState", ["game", "previous_action", "rng", "frames", "episode_ps", "demand"],
+                      defaults=(0, None, None))
+# pools of warm-start states of each configuration, simulated once per process (see TrafficControlEnv._warm_states)
+WARM_STATES = {}
     
 
 class TrafficControlEnv(gym.Env):
@@ -16,7 +27,7 @@ class TrafficControlEnv(gym.Env):
     """
     
     # macro variable of the environment
-    metadata = {"render_modes": ["human"], "render_fps": 60}
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
     
     # car directions (different formulations, we used the second)
     dirs = ["north", "east", "south", "west"]
@@ -42,12 +53,42 @@ class TrafficControlEnv(gym.Env):
             Args:
             env_info (dict): dictionary for initialization with 
                             "ps": probability of generation for the direction
+                            "ps_range": (low, high), if given the probabilities of each episode are drawn uniformly
+                                        in this range at reset instead of being ps
                             "max_wait_time": upper bound on waiting time (condition for termination)
                             "env_steps": autonomous loops of the environment between each of agent's action
+                            "fast_forward": skip the frames in which nothing happens but cars driving forward
+                                            (only without rendering, same results as frame-by-frame)
+                            "ff_min_skip": with fast_forward, the next event is only searched when at least this
+                                           number of frames come before the next arrival (default 3). A search
+                                           costs about as much as 1-2 frames, it pays off from skips of 2 frames
+                            "ff_max_backoff": with fast_forward, maximum number of frames simulated before searching
+                                              again after a search that found nothing to skip (default 16)
+                            "render_every": in human mode, draw the screen every k simulated frames (default 1)
+                            "render_fps": in human mode, draw the screen at most render_fps times per second of wall
+                                          time, e.g. metadata["render_fps"] (default None, no limit). The simulation
+                                          is never slowed down, frames are skipped instead
+                            "perf_stats": measure the time spent in each stage of the steps, available in the
+                                          "perf" entry of info and through perf_stats() (default False)
+                            "flat_obs": observations are int32 arrays (MultiDiscrete space) in the order of
+                                        obs_keys instead of dictionaries (default False)
+                            "copy_obs": with flat_obs, whether each observation is a new array (default True).
+                                        If False the same preallocated array is returned and overwritten at
+                                        every step (consumers have to copy the observations they keep)
+                            "warm_start": number of pre-simulated states from which episodes start, instead of
+                                          empty roads (default 0, disabled, see _warm_states)
+                            "warm_start_steps": actions simulated to reach each of these states (default 10)
+                            "warm_start_seed": seed of the simulation of the states (default 0)
+                            "warm_start_cache": directory in which the states are stored (default None, only
+                                                kept in memory)
         """
         
         # number of actions
         self.n_actions = len(self.action_mapper)
+        # directions whose light turns from green to red (yellow light) for each change of action
+        self.yellows = {(previous, action): [dir for dir in self.dirs
+                                             if self.action_mapper[previous][dir] and not self.action_mapper[action][dir]]
+                        for previous in self.action_mapper for action in self.action_mapper}
 
         # setup encapsulating all macro variables
         self.setup = Setup
@@ -61,8 +102,22 @@ class TrafficControlEnv(gym.Env):
         self.ps = env_info.get("ps", np.array([1/self.n_actions]*self.n_actions))
         # max waiting time (condition for termination)
         self.max_wait_time = env_info.get("max_wait_time", 1500)
+        # demand of the current episode: probabilities of generation, eventually drawn in ps_range, and
+        # time-varying multiplier of the probabilities (function of the frame index), set at each reset
+        self.ps_range = env_info.get("ps_range", None)
+        self.episode_ps = self.ps
+        self.demand = None
+        self.frames = 0
         # autonomous loops of Pygame environment for each agent's action
         self.env_steps = env_info.get("env_steps", 50) 
+        # frames between events are skipped (analytically) when no frame has to be drawn
+        self.fast_forward = env_info.get("fast_forward", False) and render_mode is None
+        # the search of the next event is only worth it for long enough skips (see step)
+        self.ff_min_skip = env_info.get("ff_min_skip", 3)
+        self.ff_max_backoff = env_info.get("ff_max_backoff", 16)
+        # frames simulated after a search that found nothing to skip, and frame of the step of the next search
+        self.ff_backoff = 1
+        self.ff_next_search = 0
         
         # render
         assert render_mode is None or render_mode in self.metadata["render_modes"]
@@ -96,6 +151,24 @@ class TrafficControlEnv(gym.Env):
                 }
             )
 
+        # keys of the observations in the order of _get_obs (the reward depends on it)
+        if self.n_states == 2:
+            self.obs_keys = [*self.dirs2, "WT", "PA"]
+        else:
+            self.obs_keys = [*self.dirs, "wt", "pa"]
+        # value of the observation in which the waiting cars of each direction are counted
+        # (modulo takes care of 2-state and 4-state scenarios)
+        self.obs_slots = [self.dir_index[dir] % self.n_states for dir in self.dirs]
+        # flat observations: the values of the dictionary, written into a preallocated array
+        # (the Dict space is kept in dict_observation_space, see obs_to_dict)
+        self.flat_obs = env_info.get("flat_obs", False)
+        self.copy_obs = env_info.get("copy_obs", True)
+        self.dict_observation_space = self.observation_space
+        if self.flat_obs:
+            self.observation_space = spaces.MultiDiscrete([self.dict_observation_space[key].n for key in self.obs_keys],
+                                                          dtype=np.int32)
+            self.observation = np.zeros(len(self.obs_keys), dtype=np.int32)
+
         # action space
         self.action_space = spaces.Discrete(self.n_actions)
         self.previous_action = None
@@ -103,45 +176,183 @@ class TrafficControlEnv(gym.Env):
         # if human-rendering is used will be initialized
         self.window = None
         self.clock = None      
+        # human rendering only redraws the areas of the screen that changed
+        self.renderer = None
+        # render schedule of human mode: events are handled at every frame, the screen is drawn every render_every
+        # frames and at most render_fps times per second
+        self.render_every = env_info.get("render_every", 1)
+        self.render_fps = env_info.get("render_fps", None)
+        self.frames_since_draw = 0
+        self.last_draw = 0.
+
+        # warm start: pool of states reached from empty roads, from which episodes start
+        self.warm_start = env_info.get("warm_start", 0)
+        self.warm_start_steps = env_info.get("warm_start_steps", 10)
+        self.warm_start_seed = env_info.get("warm_start_seed", 0)
+        self.warm_start_cache = env_info.get("warm_start_cache", None)
+
+        # timings of the stages of the steps (None if disabled), the methods of the environment implementing
+        # stages are replaced by timed versions, the ones of the game at each reset
+        self.perf = PerfStats() if env_info.get("perf_stats", False) else None
+        if self.perf is not None:
+            self.perf.wrap(self, {"_clear_yellow": "yellow", "_draw_arrivals": "arrivals", "_update_values": "get_obs",
+                                  "_get_obs": "get_obs", "_human_frame": "render", "render": "render"})
         
-    def _get_obs(self):
-        ''' Translates the environment state into an observation
-        
+    def _update_values(self):
+        ''' Translates the environment state into the values of the observation, computed at every frame for the
+            reward and the termination (the observation itself is only built once per step, see _get_obs)
+
             Returns:
-            dict: dictionary containing 
+            tuple: values in the order of obs_keys
                 - negative sum of waiting cars for each direction
                 - max waiting time (used as component of reward)
                 - previous action (active phase)
         '''
-        
-        # number of waiting cars in each line
+
+        # number of waiting cars in each line and maximum waiting time, recovered at once from the active game
+        # (the termination test reuses the maximum), previous action is stored in the environment
+        counts, max_wait_time = self.game.waiting_stats()
         waiting = [0]*self.n_states
-        for dir, sprites in self.game.cars_dict.items():
-            for car in sprites:
-                # add cars to waiting list. modulo takes care of 2-state and 4-state scenarios.
-                waiting[self.dir_index[dir]%self.n_states] += int(not car.driving)
+        for slot, n_waiting in zip(self.obs_slots, counts):
+            waiting[slot] += n_waiting
+        self.obs_values = (*waiting, max_wait_time, self.previous_action)
+        return self.obs_values
+
+    def _get_obs(self):
+        ''' Observation of the current values (see _update_values)
+
+            Returns:
+            dict: dictionary of the values (or int32 array of these values in the order of obs_keys, with flat_obs)
+        '''
+        # values are written at once into the preallocated array with flat_obs
+        if self.flat_obs:
+            self.observation[:] = self.obs_values
+            return self.observation.copy() if self.copy_obs else self.observation
         
-        # maximum waiting time recovered from the active game
-        # previous action is stored in the environment  
-        if self.n_states == 2:
-            return {**{dir: wait for dir, wait in zip(self.dirs2, waiting)}, 
-                    **{"WT": self.game.max_wait_time(), "PA": self.previous_action} }
-        else:
-            return {**{dir: wait for dir, wait in zip(self.dirs, waiting)},
-                    **{"wt": self.game.max_wait_time(), "pa": self.previous_action}}
+        return dict(zip(self.obs_keys, self.obs_values))
     
     
+    def obs_to_dict(self, observation):
+        ''' Dictionary version of an observation (as in dict_observation_space)
+
+            Args:
+            observation (dict or np.array): observation of the environment
+
+            Returns:
+            dict: values of the observation for each key
+        '''
+        if isinstance(observation, dict):
+            return observation
+        return {key: int(value) for key, value in zip(self.obs_keys, observation)}
+
     def _get_info(self):
         ''' Function returning info dictionary (environment information not used in decision process)
         
         Returns:
             dict: dictionary containing score (number of cars that exited the screen)
+                  and the timings of the step in "perf" if enabled (see perf_stats)
         '''
+        if self.perf is not None:
+            return {"score": self.game.score, "perf": self.perf.get()["step"]}
         return ({"score": self.game.score})    
+
+    def perf_stats(self):
+        ''' Timings (in nanoseconds) of the stages of the steps, with the numbers of simulated frames and of car-frames
+            (cars on the screen at each frame), requires env_info["perf_stats"]
+
+        Returns:
+            dict: dictionary containing "step" (last step) and "total" (all steps), see PerfStats.get
+        '''
+        assert self.perf is not None, "perf_stats requires env_info[\"perf_stats\"] = True"
+        return self.perf.get()
     
+    def get_state(self):
+        ''' State of the environment, that can be restored any number of times with set_state (e.g. to branch
+            simulations in a lookahead controller). It is an immutable value, cheap to store and to restore without
+            rendering (the game is then array-based)
+
+            Returns:
+            EnvState: state of the game (see Game.snapshot and HeadlessGame.snapshot), previous action, state
+                      of the generator of the environment and demand of the episode
+        '''
+        return EnvState(self.game.snapshot(), self.previous_action, self.np_random.bit_generator.state,
+                        self.frames, self.episode_ps, self.demand)
+
+    def set_state(self, state):
+        ''' Sets the environment back to a state returned by get_state, the next steps are then the same as the ones
+            that followed get_state (for the same actions)
+
+            Args:
+            state (EnvState): state of an environment with the same render mode (after reset)
+        '''
+        self.game.restore(state.game)
+        self.previous_action = state.previous_action
+        self.np_random.bit_generator.state = state.rng
+        self.frames = state.frames
+        self.episode_ps = state.episode_ps
+        self.demand = state.demand
+
+    def _warm_states(self):
+        ''' Pool of warm-start states: each state is reached after warm_start_steps actions of the fixed cycle of
+            main.py from empty roads (seeded episodes, the ones ending before are discarded). The pool is simulated
+            once per configuration and kept in memory, and in warm_start_cache if given
+
+            Returns:
+            list of EnvState: states of the game and previous actions, with scores set back to 0
+        '''
+        key = (self.render_mode is None, tuple(np.broadcast_to(self.ps, (len(self.dirs),)).tolist()),
+               self.env_steps, self.max_wait_time, self.warm_start, self.warm_start_steps, self.warm_start_seed)
+        if key in WARM_STATES:
+            return WARM_STATES[key]
+        path = None
+        if self.warm_start_cache is not None:
+            path = os.path.join(self.warm_start_cache, f"warm_start_{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.pkl")
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    WARM_STATES[key] = pickle.load(file)
+                return WARM_STATES[key]
+
+        # same dynamics (and type of game) as this environment, without warm start (fast-forward gives the same states)
+        env = TrafficControlEnv({"ps": self.ps, "max_wait_time": self.max_wait_time, "env_steps": self.env_steps,
+                                 "fast_forward": True}, render_mode=None if self.render_mode is None else "rgb_array")
+        cycle = [0]*2 + [1]
+        states = []
+        seed = self.warm_start_seed
+        while len(states) < self.warm_start:
+            if seed - self.warm_start_seed >= 10*self.warm_start:
+                raise RuntimeError("Warm start: most episodes end before warm_start_steps actions, reduce them")
+            env.reset(seed=seed)
+            seed += 1
+            terminated = False
+            for i in range(self.warm_start_steps):
+                _, _, terminated, _, _ = env.step(cycle[i % len(cycle)])
+                if terminated:
+                    break
+            if not terminated:
+                env.game.reset_score()
+                states.append(EnvState(env.game.snapshot(), env.previous_action, None))
+
+        if path is not None:
+            os.makedirs(self.warm_start_cache, exist_ok=True)
+            # written to a temporary file first, other processes never read a partial file
+            with open(f"{path}.{os.getpid()}", "wb") as file:
+                pickle.dump(states, file)
+            os.replace(f"{path}.{os.getpid()}", path)
+        WARM_STATES[key] = states
+        return states
+
     def reset(self, seed=None, options=None):
         ''' Called before step and anytime done is issued, returns tuple of initial observation and auxiliary info
             self.np_random has been used to fix the seed to a deterministic state
+
+            Args:
+            seed (int, optional): seed of the episode
+            options (dict, optional): demand and initial state of the episode
+                - "ps": probabilities of generation of the episode (default: drawn in ps_range if given, else ps)
+                - "demand": time-varying multiplier of the probabilities, vectorized function of the frame index
+                            (counted from the beginning of the episode), or parameters of Setup.cos_fun (tuple or list)
+                - "warm_start" (bool): starts from a state of the warm-start pool (see _warm_states) or from
+                                       empty roads. Defaults to env_info["warm_start"] > 0
             
             Returns:
             dict: dictionary describing the next state (information available to the agent),
@@ -151,7 +362,25 @@ class TrafficControlEnv(gym.Env):
         # enviroment seed
         super().reset(seed=seed)  
         
-        self.game = Game(self.dirs)
+        # demand of the episode
+        options = options or {}
+        if "ps" in options:
+            self.episode_ps = np.asarray(options["ps"], dtype=float)
+        elif self.ps_range is not None:
+            self.episode_ps = self.np_random.uniform(*self.ps_range, size=len(self.dirs))
+        else:
+            self.episode_ps = self.ps
+        self.demand = demand_function(options.get("demand", None))
+        self.frames = 0
+        self.ff_backoff = 1
+
+        # sprites are only needed to draw the cars, the array-based game is used otherwise
+        self.game = Game(self.dirs) if self.render_mode is not None else HeadlessGame(self.dirs)
+        if self.perf is not None:
+            self.perf.wrap(self.game, {"update_waiting": "update_waiting", "add_car": "add_car",
+                                       "move_cars": "move_cars", "frames_to_event": "frames_to_event",
+                                       "check_lights": "check_lights", "stop_behind_car": "stop_behind_car",
+                                       "update_score": "update_score", "check_crash": "check_crash"})
         
         # initial action is the red phase (all lights are turned off)
         self.previous_action = 2   
@@ -159,11 +388,25 @@ class TrafficControlEnv(gym.Env):
         # 0 waiting cars at the beginning
         dir_wait = {dir: 0 for dir in self.dirs2} if self.n_states == 2 else {dir: 0 for dir in self.dirs} 
         observation = {**dir_wait, **{"WT": 0, "PA": self.previous_action}} if self.n_states == 2 else {**dir_wait, **{"wt": 0, "pa": self.previous_action}}
+        if self.flat_obs:
+            self._update_values()
+            observation = self._get_obs()
+
+        # warm start: the episode starts from a state of the pool, drawn with the generator of the environment
+        if options.get("warm_start", self.warm_start > 0):
+            assert self.warm_start > 0, "warm start requires env_info[\"warm_start\"] > 0"
+            states = self._warm_states()
+            state = states[self.np_random.integers(len(states))]
+            self.game.restore(state.game)
+            self.previous_action = state.previous_action
+            self._update_values()
+            observation = self._get_obs()
         
         info = {"score": 0}
         
         # starting pygame screen
-        self.render()
+        if self.render_mode == "human":
+            self.render()
 
         return observation, info
     
@@ -178,31 +421,13 @@ class TrafficControlEnv(gym.Env):
                 dict: info dictionary
         '''
         
+        if self.perf is not None:
+            self.perf.start_step()
+
         # to implement yellow lights, we track the lights that were green, turning red with new action
-        if action != self.previous_action:
-            yellows = []
-            for (_, prev_light),(new_direct, new_light) in zip(self.action_mapper[self.previous_action].items(), self.action_mapper[action].items()):
-                if (prev_light) and (not new_light):
-                    yellows.append(new_direct)
-            
-            # pygame loop until all cars in the considered lanes have passed the intersection
-            while self.game.check_at_yellow(yellows): 
-                self.game.move_at_yellow()   # move cars
-                self.game.stop_behind_car() # check to stop before next cars
-                self.game.update_score()  # updating cars that exited the sc    
-                
-                # visualize these changes if rendering is active
-                if self.render_mode == "human":
-                    # draw background, visual score, lights and cars
-                    draw_all(self.window, self.game.lights_dict, self.game.score, self.game.number_cars, yellows)
-                    self.game.draw_cars(self.window)
-                    # update the screen
-                    pygame.display.update()
-                    # check for quitting
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT: 
-                                # quit Pygame
-                                self.close()  
+        yellows = self.yellows[(self.previous_action, action)]
+        if yellows:
+            self._clear_yellow(yellows)
            
         # switch to next phase, setting all appropriate lights         
         for dir_light, value_light in self.action_mapper[action].items():
@@ -212,43 +437,118 @@ class TrafficControlEnv(gym.Env):
         self.previous_action = action   # need interaction with previous action to set the yellow light
         self.game.update_waiting()  # update maximum waiting time (considered as number of user actions in which car does not move)
 
-        # environment runs autonomously for multiple frames between actions        
-        for _ in range(self.env_steps):
+        arrivals, sides, images = self._draw_arrivals()
+        # frames with arrivals, followed by the end of the step (see fast-forward)
+        arrival_frames = np.append(np.flatnonzero(arrivals.any(axis=1)), self.env_steps)
+        self.ff_next_search = 0
+
+        # environment runs autonomously for multiple frames between actions
+        frame = 0
+        while frame < self.env_steps:
                         
-            # generate cars according to given probabilities of appearence and draw them (respecting seed from gym.Env)
-            draws = self.np_random.binomial(1, p=self.ps)
-            cars_to_add = np.array(self.dirs)[np.argwhere(draws==1).ravel()]
-            for dir in cars_to_add:
-                self.game.add_car(dir)
+            # generate cars according to given probabilities of appearence
+            for dir_index in np.flatnonzero(arrivals[frame]):
+                self.game.add_car(self.dirs[dir_index], sides[frame, dir_index], image_names()[images[frame, dir_index]])
+            frame += 1
                 
             # update game state
             self.game.move_cars()  
             self.game.check_lights()
             self.game.stop_behind_car()
             self.game.update_score()
+            if self.perf is not None:
+                self.perf.count(1, self.game.number_cars - self.game.score)
 
-            # get next state and info
-            observation = self._get_obs()
-            info = self._get_info()
+            # values of the next state (the observation is built once, after the frames)
+            values = self._update_values()
             
             # consistent reward (from https://www.sciencedirect.com/science/article/pii/S0950705123001909)
-            reward = - np.sum(list(observation.values())[:2]) - int(8*list(observation.values())[2])
+            reward = - values[0] - values[1] - 8*values[2]
             
-            # render pygame if expected
-            if self.render_mode == "human":
-                self.render()
-
             # Conditions for termination: 1. crash, 2. maximum waiting time surpassed
-            if self.game.check_crash() or self.game.max_wait_time()>self.max_wait_time:
+            if self.game.check_crash() or values[-2] > self.max_wait_time:
                 reward = -5000  
                 terminated = True
+
+            # render pygame if expected (last frame of the episode is always drawn)
+            if self.render_mode == "human":
+                self._human_frame(force=terminated)
+            if terminated:
                 break
+
+            # frames before the next arrival or event only move the driving cars: observation, reward and info
+            # stay the same (the maximum waiting time cannot increase, no crash can happen)
+            # Searching the next event costs about as much as simulating 1-2 frames: it is only done when at least
+            # ff_min_skip frames come before the next arrival, and searches finding nothing to skip (dense traffic)
+            # space out the next ones (up to ff_max_backoff frames). Frames that are not skipped are simulated,
+            # the results are the same in any case
+            if self.fast_forward and frame >= self.ff_next_search:
+                skip = int(arrival_frames[np.searchsorted(arrival_frames, frame)]) - frame
+                if skip >= self.ff_min_skip:
+                    skip = min(skip, int(self.game.frames_to_event()[0]) - 1)
+                    if skip > 0:
+                        self.game.move_cars(frames=skip)
+                        frame += skip
+                        self.ff_backoff = 1
+                        if self.perf is not None:
+                            self.perf.count(skip, self.game.number_cars - self.game.score)
+                    else:
+                        self.ff_next_search = frame + self.ff_backoff
+                        self.ff_backoff = min(2*self.ff_backoff, self.ff_max_backoff)
                     
-        return observation, reward, terminated, False, info
+        # observation and info are built once the frames of the step are simulated (timings of the whole step)
+        return self._get_obs(), reward, terminated, False, self._get_info()
     
 
+    def _clear_yellow(self, yellows):
+        ''' Yellow lights: the cars of the lanes whose light turns red clear the intersection before the next phase
+
+            Args:
+            yellows (list of str): directions whose light turns from green to red
+        '''
+        if self.render_mode != "human":
+            # all cars in the considered lanes pass the intersection, computed at once
+            frames = self.game.clear_yellow(yellows)
+            if self.perf is not None:
+                self.perf.count(frames, self.game.number_cars - self.game.score)
+            return
+        # pygame loop until all cars in the considered lanes have passed the intersection (with a maximum duration)
+        for _ in range(Setup.YELLOW_MAX_FRAMES):
+            if not self.game.check_at_yellow(yellows):
+                break
+            self.game.move_at_yellow()   # move cars
+            self.game.stop_behind_car() # check to stop before next cars
+            self.game.update_score()  # updating cars that exited the sc    
+            if self.perf is not None:
+                self.perf.count(1, self.game.number_cars - self.game.score)
+            
+            # visualize these changes (following the render schedule)
+            self._human_frame(yellows)
+
+    def _draw_arrivals(self):
+        ''' Arrivals of all the frames of the action, with the traffic lane and the image of each potential new car,
+            drawn at once from the environment's generator (an episode only depends on the seed given to reset)
+
+            Returns:
+            np.array: boolean array of shape (env_steps, number of directions), whether a car arrives
+            np.array: traffic lane (index in NUDGES) of each potential new car, same shape
+            np.array: image (index in image_names()) of each potential new car, same shape
+        '''
+        ps = self.episode_ps
+        if self.demand is not None:
+            # probabilities of each frame, scaled by the demand at the frame
+            ps = ps * np.asarray(self.demand(self.frames + np.arange(self.env_steps)))[:, None]
+        self.frames += self.env_steps
+        arrivals = self.np_random.random((self.env_steps, len(self.dirs))) < ps
+        sides = self.np_random.integers(len(NUDGES), size=arrivals.shape)
+        images = self.np_random.integers(len(image_names()), size=arrivals.shape)
+        return arrivals, sides, images
+
     def render(self):
         """ Function to handle Pygame
+
+        Returns:
+            np.array: in rgb_array mode, current frame as an array of shape (height, width, 3)
         """
         # initialize pygame if screen does not exist yet (first call in reset)
         if self.window is None and self.render_mode == "human":
@@ -258,45 +558,85 @@ class TrafficControlEnv(gym.Env):
             # set up the window
             self.window = pygame.display.set_mode(self.window_size)
             pygame.display.set_caption("Traffic Control")
+            self.renderer = Renderer()
             
-        # initialize clock to control FPS of the screen
+        # initialize clock measuring the rate of drawn frames (self.clock.get_fps())
         if self.clock is None and self.render_mode == "human":
             self.clock = pygame.time.Clock()
             
         if self.render_mode == "human":
-            # draw everything
+            self._handle_events()
+            self._draw()
+        
+        # rgb_array: same drawing on an offscreen surface, whose pixels are copied once into a (height, width, 3) array
+        elif self.render_mode == "rgb_array":
+            if self.window is None:
+                self.window = pygame.Surface(self.window_size)
             draw_all(self.window, self.game.lights_dict, self.game.score, self.game.number_cars)
             self.game.draw_cars(self.window)
+            return np.array(pygame.surfarray.pixels3d(self.window).transpose(1, 0, 2))
         
-            # handle events
-            for event in pygame.event.get():
-                    
-                # used only during experiments (user control of lights switch)
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT:
-                        self.game.switch_light("west")
-                    if event.key == pygame.K_UP:
-                        self.game.switch_light("north")
-                    if event.key == pygame.K_RIGHT:
-                        self.game.switch_light("east")
-                    if event.key == pygame.K_DOWN:
-                        self.game.switch_light("south")
+    def _handle_events(self):
+        """ Handles Pygame events (keyboard control of the lights and quitting), at every frame in human mode
+        """
+        for event in pygame.event.get():
                 
-                if event.type == pygame.QUIT: 
-                    # quit Pygame
-                    self.close()
-        
-            # Update the screen
-            pygame.display.update()
-        
-         # rgb_array
-        else: 
-            pass  # not implemented
-        
+            # used only during experiments (user control of lights switch)
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT:
+                    self.game.switch_light("west")
+                if event.key == pygame.K_UP:
+                    self.game.switch_light("north")
+                if event.key == pygame.K_RIGHT:
+                    self.game.switch_light("east")
+                if event.key == pygame.K_DOWN:
+                    self.game.switch_light("south")
+            
+            if event.type == pygame.QUIT: 
+                # the user closed the window: quit Pygame and the game
+                self.close()
+                sys.exit()
+
+    def _draw(self, yellows=[]):
+        """ Draws what changed since the previous drawing (background under the cars that moved, cars, lights, score)
+            and updates these areas of the screen
+
+        Args:
+            yellows (list, optional): list of directions whose light has to be set to yellow if any. Defaults to [].
+        """
+        pygame.display.update(self.renderer.draw(self.window, self.game, yellows))
+        self.clock.tick()
+        self.frames_since_draw = 0
+        self.last_draw = time.perf_counter()
+
+    def _human_frame(self, yellows=[], force=False):
+        """ Called at every simulated frame in human mode: events are handled at every frame, while the screen is
+            only drawn every render_every frames and at most render_fps times per second of wall time
+
+        Args:
+            yellows (list, optional): list of directions whose light has to be set to yellow if any. Defaults to [].
+            force (bool, optional): draw the frame whatever the schedule. Defaults to False.
+        """
+        self._handle_events()
+        self.frames_since_draw += 1
+        if not force:
+            if self.frames_since_draw < self.render_every:
+                return
+            if self.render_fps and time.perf_counter() - self.last_draw < 1/self.render_fps:
+                return
+        self._draw(yellows)
+
     def close(self):
-        ''' close any open resources that were used by the environment
+        ''' close any open resources that were used by the environment (window and pygame in human mode).
+            The interpreter is never exited (environments can run in worker processes, e.g. in AsyncVectorEnv),
+            and a new window is opened if the environment is rendered again
         '''
-        if self.window is not None:
+        if self.window is not None and self.render_mode == "human":
             pygame.quit()
-            sys.exit()
+            # fonts (and the texts rendered with them) are not valid anymore once pygame has quit
+            FONT_CACHE.clear()
+            text_surface.cache_clear()
+        self.window = None
+        self.clock = None
+        self.renderer = None
             
\ No newline at end of file
@@ -0,0 +1,161 @@
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from traffic_control_game.envs.TrafficControl import TrafficControlEnv
+from traffic_control_game.envs.TrafficControlVector import BatchEnvMixin
+from traffic_control_game.envs.logic import NUDGES
+from traffic_control_game.envs.network import Network, NetworkGame
+
+
+class TrafficControlNetworkEnv(BatchEnvMixin, gym.Env):
+    """ Traffic Control environment for a network of intersections (e.g. a corridor or a grid of junctions), with one
+        action for each of them. Cars arrive at the entries of the network and are handed from junction to junction
+        until they leave it, the dynamics of each junction are the ones of TrafficControlEnv
+    """
+
+    metadata = {"render_modes": []}
+
+    def __init__(self, env_info, render_mode=None):
+        """ Initialization, parameters are the ones of TrafficControlEnv
+
+            Args:
+            env_info (dict): dictionary for initialization, see TrafficControlEnv, with
+                            "network": Network, or (rows, cols) of a grid of intersections (default (1, 1))
+                            "ps": probability of generation for the direction, at each entry of the network
+                            "jit": use the compiled kernel of the lanes if Numba is installed (default True)
+            render_mode (None): rendering is not available for networks
+        """
+        assert render_mode is None, "TrafficControlNetworkEnv can only be used without rendering"
+        # single environment (never stepped), used to parse env_info
+        single = TrafficControlEnv(env_info)
+        self.dirs = single.dirs
+        self.n_states = single.n_states
+        self.n_actions = single.n_actions
+        self.max_wait_time = single.max_wait_time
+        self.env_steps = single.env_steps
+        self.obs_keys = single.obs_keys
+
+        network = env_info.get("network", (1, 1))
+        self.network = network if isinstance(network, Network) else Network.grid(*network, self.dirs)
+        self.n_junctions = self.network.n_junctions
+        # entries of the network and their probability of generation
+        self.entry_junctions, self.entry_dirs = self.network.entries()
+        self.entry_ps = np.broadcast_to(np.asarray(single.ps, dtype=float), (len(self.dirs),))[self.entry_dirs]
+
+        # observation of each junction as a row of an int32 array (see flat_obs of TrafficControlEnv)
+        nvec = [single.dict_observation_space[key].n for key in self.obs_keys]
+        self.observation_space = spaces.MultiDiscrete(np.tile(nvec, (self.n_junctions, 1)), dtype=np.int32)
+        self.action_space = spaces.MultiDiscrete([self.n_actions]*self.n_junctions)
+
+        # lights of the actions and observations of each junction (see BatchEnvMixin)
+        self._init_phases(single)
+
+        self.jit = env_info.get("jit", True)
+        self.game = None
+        self.previous_action = None
+
+    def _counts(self):
+        """ Scores of the junctions and number of cars waiting to enter a junction
+        """
+        return self.game.scores.copy(), len(self.game.pending)
+
+    def _get_info(self, values=None):
+        ''' Function returning info dictionary (environment information not used in decision process)
+
+            Args:
+            values (np.array, optional): values of the observations, for the reward of each junction
+
+            Returns:
+            dict: dictionary containing score (number of cars that left the network), the number of cars that left
+                  it at each junction ("scores"), the cars waiting to enter a junction ("pending") and the reward of
+                  each junction ("rewards") after a step
+        '''
+        scores, pending = self._counts()
+        info = {"score": int(scores.sum()), "scores": scores, "pending": pending}
+        if values is not None:
+            info["rewards"] = - values[:, 0] - values[:, 1] - 8*values[:, 2]
+        return info
+
+    def reset(self, seed=None, options=None):
+        ''' Empty roads in the whole network, all lights red as previous phase
+
+            Args:
+            seed (int, optional): seed of the episode
+            options (dict, optional): not used
+
+            Returns:
+            np.array: observations of the junctions,
+            dict: info dictionary (containing score)
+        '''
+        super().reset(seed=seed)
+        self.game = NetworkGame(self.network, jit=self.jit)
+        self.previous_action = np.full(self.n_junctions, 2)
+        return self._get_values().astype(np.int32), self._get_info()
+
+    def _simulate(self, action, arrivals, sides, entries, exchange=None, exchange_frames=None):
+        ''' Simulates the frames of an action on the junctions of the game (the whole network, or a shard of it in
+            TrafficControlShardedEnv, see shard_worker)
+
+            Args:
+            action (np.array): action of each junction of the game
+            arrivals (np.array): new car at each frame and entry of the game, of shape (env_steps, len(entries))
+            sides (np.array): traffic lane (index in NUDGES) of the new cars, of the same shape
+            entries (np.array): entries of the game (indices in entry_junctions and entry_dirs)
+            exchange (callable, optional): hands the cars to the other shards, called before the first frame and
+                                           every exchange_frames frames with whether the game is over, returns
+                                           whether the episode is over in any shard. Defaults to no exchange.
+            exchange_frames (int, optional): frames between two calls of exchange
+
+            Returns:
+            bool: whether the episode is over
+        '''
+        game = self.game
+
+        # yellow lights: cars of the lights that turn red with the new action clear the intersection
+        game.clear_yellows(self.yellows[self.previous_action, action])
+
+        # switch to next phase
+        game.set_lights(self.phases[action])
+        self.previous_action = action.copy()
+        game.update_waiting()
+
+        entry_games = game.local_games[self.entry_junctions[entries]]
+        entry_dirs = self.entry_dirs[entries]
+        period = self.env_steps if exchange is None else exchange_frames
+        over = exchange is not None and exchange(False)
+        start = 0
+        while start < self.env_steps and not over:
+            terminated = False
+            for frame in range(start, min(start + period, self.env_steps)):
+                # cars handed by upstream junctions and new cars enter their lane if it is not full, then the game
+                # is updated. Conditions for termination: 1. crash, 2. maximum waiting time surpassed (at any junction)
+                new = np.flatnonzero(arrivals[frame])
+                lanes = game.lane_ids(entry_games[new], entry_dirs[new], sides[frame, new])
+                if game.frame(lanes, self.max_wait_time):
+                    terminated = True
+                    break
+            start += period
+            over = terminated if exchange is None else exchange(terminated)
+        return over
+
+    def step(self, action):
+        ''' Computes next state of the network, with one action for each junction
+
+            Returns:
+                np.array: observations of the junctions
+                float: reward, sum of the rewards of the junctions (see TrafficControlEnv.step)
+                bool: terminated, a crash or a car waiting too long at any junction
+                bool: truncated (always False)
+                dict: info dictionary
+        '''
+        # arrivals of all the frames of the action, at the entries of the network only
+        arrivals = self.np_random.random((self.env_steps, len(self.entry_dirs))) < self.entry_ps
+        sides = self.np_random.integers(len(NUDGES), size=arrivals.shape)
+        terminated = self._simulate(np.asarray(action, dtype=np.int64), arrivals, sides,
+                                    np.arange(len(self.entry_dirs)))
+
+        # consistent reward of each junction, summed over the network
+        values = self._get_values()
+        info = self._get_info(values)
+        reward = -5000 if terminated else int(info["rewards"].sum())
+        return values.astype(np.int32), reward, terminated, False, info
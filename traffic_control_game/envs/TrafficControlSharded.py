@@ -0,0 +1,229 @@
+import ctypes
+import multiprocessing as mp
+import os
+import traceback
+import gymnasium as gym
+import numpy as np
+from traffic_control_game.envs.TrafficControlNetwork import TrafficControlNetworkEnv
+from traffic_control_game.envs.logic import Setup, NUDGES
+from traffic_control_game.envs.network import NetworkGame
+
+
+def shared_array(ctx, shape, dtype):
+    """ Array in shared memory, allocated before the workers are started (with any start method)
+
+    Args:
+        ctx (multiprocessing context): context of the workers
+        shape (tuple): shape of the array
+        dtype (type): NumPy type of the array
+
+    Returns:
+        tuple: raw shared memory, type and shape, to be given to the workers (see as_array)
+    """
+    return ctx.RawArray(ctypes.c_byte, max(int(np.prod(shape))*np.dtype(dtype).itemsize, 1)), dtype, shape
+
+
+def as_array(shared):
+    """ NumPy view of an array returned by shared_array (no copy)
+    """
+    raw, dtype, shape = shared
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def shard_worker(env_info, network, shard, partition, exchange_frames, shared, pipe, barrier):
+    """ Process simulating the junctions of one shard of the network, stepped by TrafficControlShardedEnv.
+        Commands ("reset", "step", "close") are received through the pipe, and all the data (actions, arrivals,
+        observations, scores and handed cars) is exchanged through shared memory. The shards exchange the cars
+        crossing their boundaries every exchange_frames frames, waiting for each other at the barrier
+
+    Args:
+        env_info (dict): dictionary for initialization, see TrafficControlNetworkEnv
+        network (Network): whole network
+        shard (int): index of the shard
+        partition (np.array): shard of each junction
+        exchange_frames (int): frames between the exchanges of handed cars
+        shared (dict): arrays in shared memory (see shared_array)
+        pipe (multiprocessing.Connection): commands, answered with None once done (or with the error)
+        barrier (multiprocessing.Barrier): barrier of all the workers
+    """
+    env = TrafficControlNetworkEnv({**env_info, "network": network})
+    arrays = {name: as_array(value) for name, value in shared.items()}
+    junctions = np.flatnonzero(partition == shard)
+    # entries of the network in this shard (columns of the arrivals drawn by the environment)
+    entries = np.flatnonzero(partition[env.entry_junctions] == shard)
+    game = None
+
+    def exchange(terminated):
+        """ Hands the cars that left the shard to the other shards and receives theirs
+
+        Returns:
+            bool: whether the episode is over in any shard
+        """
+        out = game.outgoing
+        assert len(out) <= arrays["outbox"].shape[1], "too many cars handed between two exchanges"
+        arrays["outbox"][shard, :len(out)] = out
+        arrays["out_count"][shard] = len(out)
+        arrays["terminated"][shard] = terminated
+        game.outgoing = out[:0]
+        barrier.wait()
+        for other in range(len(arrays["out_count"])):
+            lanes = arrays["outbox"][other, :arrays["out_count"][other]]
+            game.receive(lanes[partition[lanes // game.n_lanes] == shard])
+        over = bool(arrays["terminated"].any())
+        # the outboxes are written again only once every shard has read them
+        barrier.wait()
+        return over
+
+    while True:
+        command = pipe.recv()
+        try:
+            if command == "close":
+                break
+
+            if command == "reset":
+                game = NetworkGame(network, junctions, jit=env.jit)
+                env.game = game
+                env.previous_action = np.full(len(junctions), 2)
+
+            if command == "step":
+                # same step as TrafficControlNetworkEnv.step, on the junctions of the shard
+                env._simulate(arrays["actions"][junctions].copy(), arrays["arrivals"][:, entries],
+                              arrays["sides"][:, entries], entries, exchange, exchange_frames)
+
+            arrays["values"][junctions] = env._get_values()
+            arrays["scores"][junctions] = game.scores
+            arrays["pending"][shard] = len(game.pending)
+            pipe.send(None)
+        except Exception:
+            # the other shards would wait forever at the barrier
+            barrier.abort()
+            pipe.send(traceback.format_exc())
+    pipe.close()
+
+
+class TrafficControlShardedEnv(TrafficControlNetworkEnv):
+    """ TrafficControlNetworkEnv whose junctions are partitioned into shards, each one simulated by a worker process.
+        Workers only exchange the cars crossing the boundaries of their shard, through shared memory. Exchanging
+        them at every frame gives exactly the episodes of TrafficControlNetworkEnv, less frequent exchanges delay
+        the cars crossing the boundaries (they wait for the next exchange before entering their lane)
+    """
+
+    def __init__(self, env_info, render_mode=None):
+        """ Initialization, parameters are the ones of TrafficControlNetworkEnv
+
+            Args:
+            env_info (dict): dictionary for initialization, see TrafficControlNetworkEnv, with
+                            "n_workers": number of worker processes (default os.cpu_count())
+                            "partition": shard of each junction (default contiguous blocks of junctions, bands
+                                         of rows for grids)
+                            "exchange_frames": frames between exchanges of the cars crossing the boundaries of the
+                                               shards (default env_steps, once per action; 1 for exact episodes)
+                            "mp_context": start method of the workers (default: the one of the platform)
+            render_mode (None): rendering is not available for networks
+        """
+        super().__init__(env_info, render_mode)
+        n_workers = min(env_info.get("n_workers", os.cpu_count()), self.n_junctions)
+        partition = env_info.get("partition", None)
+        if partition is None:
+            partition = np.arange(self.n_junctions)*n_workers // self.n_junctions
+        self.partition = np.asarray(partition, dtype=np.int64)
+        self.n_workers = int(self.partition.max()) + 1
+        self.exchange_frames = env_info.get("exchange_frames", self.env_steps)
+
+        # each lane leaving a shard hands at most one car per frame (cars of a lane never overlap), and the
+        # cars clearing the intersection at yellow lights move for at most YELLOW_MAX_FRAMES frames
+        downstream = self.network.downstream
+        crossing = (downstream >= 0) & (self.partition[downstream] != self.partition[:, None])
+        boundary = np.bincount(self.partition, weights=crossing.sum(axis=1), minlength=self.n_workers).max()
+        capacity = int(2*boundary*(max(self.exchange_frames, Setup.YELLOW_MAX_FRAMES) + 1))
+
+        ctx = mp.get_context(env_info.get("mp_context", None))
+        shapes = {"actions": ((self.n_junctions,), np.int64),
+                  "arrivals": ((self.env_steps, len(self.entry_dirs)), np.bool_),
+                  "sides": ((self.env_steps, len(self.entry_dirs)), np.int64),
+                  "values": ((self.n_junctions, len(self.obs_keys)), np.int64),
+                  "scores": ((self.n_junctions,), np.int64),
+                  "pending": ((self.n_workers,), np.int64),
+                  "terminated": ((self.n_workers,), np.bool_),
+                  "outbox": ((self.n_workers, capacity), np.int64),
+                  "out_count": ((self.n_workers,), np.int64)}
+        shared = {name: shared_array(ctx, shape, dtype) for name, (shape, dtype) in shapes.items()}
+        self.arrays = {name: as_array(value) for name, value in shared.items()}
+
+        # the barrier is kept alive with the environment, spawned workers only receive a reference to it
+        self.barrier = ctx.Barrier(self.n_workers)
+        # after an error in a worker, the shards are in different frames until the next reset
+        self.needs_reset = True
+        self.pipes = []
+        self.workers = []
+        for shard in range(self.n_workers):
+            pipe, worker_pipe = ctx.Pipe()
+            worker = ctx.Process(target=shard_worker, daemon=True,
+                                 args=(env_info, self.network, shard, self.partition, self.exchange_frames,
+                                       shared, worker_pipe, self.barrier))
+            worker.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.workers.append(worker)
+
+    def _run(self, command):
+        """ Sends a command to all the workers and waits until they are done
+        """
+        for pipe in self.pipes:
+            pipe.send(command)
+        try:
+            errors = [error for error in [pipe.recv() for pipe in self.pipes] if error is not None]
+        except (EOFError, ConnectionError):
+            raise RuntimeError("A worker of TrafficControlShardedEnv has stopped")
+        if errors:
+            # every worker has answered: the barrier aborted by the failing one can be used again once the
+            # environment is reset
+            self.barrier.reset()
+            self.needs_reset = True
+            raise RuntimeError(f"Error in a worker of TrafficControlShardedEnv (reset the environment to "
+                               f"continue):\n{errors[0]}")
+
+    def _counts(self):
+        """ Scores of the junctions and number of cars waiting to enter a junction, gathered from the shards
+        """
+        return self.arrays["scores"].copy(), int(self.arrays["pending"].sum())
+
+    def reset(self, seed=None, options=None):
+        ''' Empty roads in the whole network, all lights red as previous phase, see TrafficControlNetworkEnv.reset
+        '''
+        gym.Env.reset(self, seed=seed)
+        self._run("reset")
+        self.needs_reset = False
+        self.previous_action = np.full(self.n_junctions, 2)
+        return self.arrays["values"].astype(np.int32), self._get_info()
+
+    def step(self, action):
+        ''' Computes next state of the network, with one action for each junction, see TrafficControlNetworkEnv.step
+        '''
+        if self.needs_reset:
+            raise RuntimeError("TrafficControlShardedEnv has to be reset before the first step and after an error "
+                               "in a worker")
+        self.previous_action = np.asarray(action, dtype=np.int64).copy()
+        self.arrays["actions"][:] = self.previous_action
+        # arrivals are drawn by the environment, as in TrafficControlNetworkEnv (the episode only depends on the seed)
+        arrivals = self.np_random.random((self.env_steps, len(self.entry_dirs))) < self.entry_ps
+        self.arrays["arrivals"][:] = arrivals
+        self.arrays["sides"][:] = self.np_random.integers(len(NUDGES), size=arrivals.shape)
+        self._run("step")
+
+        values = self.arrays["values"].copy()
+        terminated = bool(self.arrays["terminated"].any())
+        info = self._get_info(values)
+        reward = -5000 if terminated else int(info["rewards"].sum())
+        return values.astype(np.int32), reward, terminated, False, info
+
+    def close(self):
+        ''' Stops the worker processes
+        '''
+        for pipe, worker in zip(self.pipes, self.workers):
+            if worker.is_alive():
+                pipe.send("close")
+            worker.join()
+            pipe.close()
+        self.pipes = []
+        self.workers = []
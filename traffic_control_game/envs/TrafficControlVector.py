@@ -0,0 +1,227 @@
+import numpy as np
+from gymnasium.utils import seeding
+from gymnasium.vector import VectorEnv
+from traffic_control_game.envs.TrafficControl import TrafficControlEnv
+from traffic_control_game.envs.logic import NUDGES, demand_function
+from traffic_control_game.envs.headless import BatchGame
+
+
+class BatchEnvMixin:
+    """ Lights and observations shared by the environments whose intersections are the games of a BatchGame
+        (TrafficControlVectorEnv and TrafficControlNetworkEnv), with one action for each of them
+    """
+
+    def _init_phases(self, single):
+        """ Lights of the actions and directions of the observations, from the ones of a single environment
+
+            Args:
+            single (TrafficControlEnv): single environment with the same env_info
+        """
+        # lights of each action as a boolean array of shape (n_actions, n_dirs)
+        self.phases = np.array([[single.action_mapper[action][dir] for dir in self.dirs]
+                                for action in range(self.n_actions)])
+        # yellow lights (lights that were green and turn red) for each previous action and action
+        self.yellows = self.phases[:, None] & ~self.phases[None]
+        # direction of each light, summed into the observation (modulo takes care of 2-state and 4-state scenarios)
+        self.obs_index = np.eye(self.n_states, dtype=np.int64)[[single.dir_index[dir] % self.n_states for dir in self.dirs]]
+
+    def _get_values(self):
+        ''' Translates the state of the intersections into a batch of observations
+
+            Returns:
+            np.array: values of the observations, of shape (number of games of the BatchGame, len(obs_keys))
+        '''
+        values = np.empty((self.game.n_games, len(self.obs_keys)), dtype=np.int64)
+        values[:, :self.n_states] = self.game.waiting_counts() @ self.obs_index
+        values[:, -2] = self.game.max_wait_times()
+        values[:, -1] = self.previous_action
+        return values
+
+
+class TrafficControlVectorEnv(BatchEnvMixin, VectorEnv):
+    """ Vectorized version of the Traffic Control environment: num_envs independent intersections
+        are stored in a single BatchGame and stepped together, with one action for each of them.
+        Finished intersections are reset automatically, as in gymnasium's SyncVectorEnv
+    """
+
+    def __init__(self, num_envs, env_info, render_mode=None):
+        """ Initialization, spaces and parameters are the ones of TrafficControlEnv
+
+            Args:
+            num_envs (int): number of intersections
+            env_info (dict): dictionary for initialization, see TrafficControlEnv, with
+                            "jit": use the compiled kernel of the lanes if Numba is installed (default True)
+            render_mode (None): rendering is not available for the vectorized environment
+        """
+        assert render_mode is None, "TrafficControlVectorEnv can only be used without rendering"
+        # single environment (never stepped), used to parse env_info and to define the spaces
+        single = TrafficControlEnv(env_info)
+        super().__init__(num_envs, single.observation_space, single.action_space)
+
+        self.dirs = single.dirs
+        self.n_states = single.n_states
+        self.n_actions = single.n_actions
+        self.base_ps = np.broadcast_to(np.asarray(single.ps, dtype=float), (len(self.dirs),))
+        # demand of the episode of each intersection (drawn in ps_range at each reset if given), time-varying
+        # multiplier of the probabilities (function of the frame index) and frames since the reset of each intersection
+        self.ps_range = single.ps_range
+        self.ps = np.tile(self.base_ps, (num_envs, 1))
+        self.demand = None
+        self.frames = np.zeros(num_envs, dtype=np.int64)
+        self.max_wait_time = single.max_wait_time
+        self.env_steps = single.env_steps
+        # keys in the order of the observations of the single environment (the reward depends on it)
+        self.obs_keys = single.obs_keys
+        # observations as one int32 array of shape (num_envs, len(obs_keys)) instead of a dictionary of arrays
+        self.flat_obs = single.flat_obs
+        # lights of the actions and observations of each intersection (see BatchEnvMixin)
+        self._init_phases(single)
+
+        # cars are advanced by the compiled kernel of the lanes if Numba is installed (see BatchGame.advance)
+        self.game = BatchGame(self.dirs, n_games=num_envs, jit=env_info.get("jit", True))
+        self.previous_action = np.full(num_envs, 2)
+        self._np_random = None
+
+    def _format_obs(self, values):
+        ''' Observations in the format of the observation space
+
+            Args:
+            values (np.array): values of the observations, of shape (n, len(obs_keys))
+
+            Returns:
+            dict or np.array: dictionary of arrays with the same keys as TrafficControlEnv, or int32 array
+                              of shape (n, len(obs_keys)) with flat_obs
+        '''
+        if self.flat_obs:
+            return values.astype(np.int32)
+        return {key: values[:, i] for i, key in enumerate(self.obs_keys)}
+
+    def _get_obs(self, games=None):
+        ''' Translates the state of the intersections into a batch of observations
+
+            Args:
+            games (np.array, optional): boolean mask of the intersections to return. Defaults to all intersections.
+
+            Returns:
+            dict or np.array: batch of observations (see _format_obs)
+        '''
+        values = self._get_values()
+        return self._format_obs(values if games is None else values[games])
+
+    def reset_wait(self, seed=None, options=None):
+        ''' Resets all the intersections
+
+            Args:
+            seed (int, optional): seed of the generator of the environment
+            options (dict, optional): demand of the episodes, see TrafficControlEnv.reset
+                - "ps": probabilities of generation, of shape (n_dirs,) or (num_envs, n_dirs), of the current
+                        episodes (the episodes starting after an automatic reset use the default demand)
+                - "demand": time-varying multiplier of the probabilities, vectorized function of the frame index
+                            (counted from the reset of each intersection), or parameters of Setup.cos_fun (tuple or list)
+
+            Returns:
+            dict: batch of initial observations,
+            dict: info dictionary (containing score)
+        '''
+        if seed is not None or self._np_random is None:
+            self._np_random, _ = seeding.np_random(seed)
+        self._reset_games(np.ones(self.num_envs, dtype=bool))
+        options = options or {}
+        if "ps" in options:
+            self.ps[:] = np.broadcast_to(np.asarray(options["ps"], dtype=float), self.ps.shape)
+        self.demand = demand_function(options.get("demand", None))
+        return self._get_obs(), {"score": self.game.scores.copy(), "_score": np.ones(self.num_envs, dtype=bool)}
+
+    def _reset_games(self, games):
+        ''' Starts a new episode for the given intersections (empty roads, all lights red as previous phase), with
+            probabilities of generation drawn in ps_range for all of them at once if given
+        '''
+        self.game.reset_games(games)
+        self.previous_action[games] = 2
+        self.frames[games] = 0
+        if self.ps_range is None:
+            self.ps[games] = self.base_ps
+        else:
+            self.ps[games] = self._np_random.uniform(*self.ps_range, size=(int(games.sum()), len(self.dirs)))
+
+    def step_async(self, actions):
+        ''' Stores the actions of the next call to step_wait
+        '''
+        self._actions = np.asarray(actions, dtype=np.int64)
+
+    def step_wait(self):
+        ''' Computes next state of all the intersections, with the same dynamics as TrafficControlEnv.step
+
+            Returns:
+                dict: batch of observations (after automatic reset of the finished intersections)
+                np.array: rewards
+                np.array: terminated, for each intersection
+                np.array: truncated (always False)
+                dict: info dictionary, with final observation and info of the finished intersections
+        '''
+        actions = self._actions
+        game = self.game
+
+        # yellow lights: cars of the lights that turn red with the new action clear the intersection
+        game.clear_yellows(self.yellows[self.previous_action, actions])
+
+        # switch to next phase
+        game.set_lights(self.phases[actions])
+        self.previous_action = actions.copy()
+        game.update_waiting()
+
+        observation = self._get_values()
+        rewards = np.zeros(self.num_envs)
+        terminated = np.zeros(self.num_envs, dtype=bool)
+        # finished intersections are not updated anymore until the end of the step
+        running = np.ones(self.num_envs, dtype=bool)
+        # arrivals of all the frames of the action, with the traffic lane of each potential new car
+        ps = self.ps
+        if self.demand is not None:
+            # probabilities of each frame and intersection, scaled by the demand at the frame
+            ps = ps * np.asarray(self.demand(self.frames + np.arange(self.env_steps)[:, None]))[..., None]
+        self.frames += self.env_steps
+        arrivals = self._np_random.random((self.env_steps, self.num_envs, len(self.dirs))) < ps
+        sides = self._np_random.integers(len(NUDGES), size=arrivals.shape)
+        for frame in range(self.env_steps):
+
+            # batched arrivals, each new car enters its lane if it is not full
+            games, dirs = np.nonzero(arrivals[frame] & running[:, None])
+            lanes = game.lane_ids(games, dirs, sides[frame, games, dirs])
+            game.add_cars(lanes[game.can_add_cars(lanes)])
+
+            # update game state
+            game.advance(game.driving & running[game.games_of_cars()])
+            game.update_scores()
+
+            frame_observation = self._get_values()
+            observation[running] = frame_observation[running]
+            frame_rewards = - frame_observation[:, 0] - frame_observation[:, 1] - 8*frame_observation[:, 2]
+            rewards[running] = frame_rewards[running]
+
+            # Conditions for termination: 1. crash, 2. maximum waiting time surpassed
+            crashed = running & (game.crashes() | (game.max_wait_times() > self.max_wait_time))
+            rewards[crashed] = -5000
+            terminated |= crashed
+            running &= ~crashed
+            if not running.any():
+                break
+
+        infos = {"score": game.scores.copy(), "_score": np.ones(self.num_envs, dtype=bool)}
+        if terminated.any():
+            infos["final_observation"] = np.full(self.num_envs, None, dtype=object)
+            infos["final_info"] = np.full(self.num_envs, None, dtype=object)
+            final_observation = self._format_obs(observation)
+            for i in np.flatnonzero(terminated):
+                if self.flat_obs:
+                    infos["final_observation"][i] = final_observation[i]
+                else:
+                    infos["final_observation"][i] = {key: final_observation[key][i] for key in self.obs_keys}
+                infos["final_info"][i] = {"score": int(game.scores[i])}
+            infos["_final_observation"] = terminated.copy()
+            infos["_final_info"] = terminated.copy()
+            self._reset_games(terminated)
+            infos["score"][terminated] = 0
+            observation[terminated] = self._get_values()[terminated]
+
+        return self._format_obs(observation), rewards, terminated, np.zeros(self.num_envs, dtype=bool), infos
@@ -1,2 +1,6 @@
 
 from traffic_control_game.envs.TrafficControl import TrafficControlEnv
+from traffic_control_game.envs.TrafficControlVector import TrafficControlVectorEnv
+from traffic_control_game.envs.TrafficControlNetwork import TrafficControlNetworkEnv
+from traffic_control_game.envs.network import Network
+from traffic_control_game.envs.TrafficControlSharded import TrafficControlShardedEnv
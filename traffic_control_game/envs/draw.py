@@ -1,5 +1,6 @@
 import pygame
 import math
+from functools import lru_cache
 from traffic_control_game.envs.logic import *
 
 
@@ -7,6 +8,24 @@ from traffic_control_game.envs.logic import *
 dist_center = Setup.DIST_CENTER
 center_y = Setup.CENTER_Y
 center_x = Setup.CENTER_X
+# fonts, loaded the first time they are needed (looking up system fonts is slow)
+FONT_CACHE = {}
+
+
+def get_font(name="geneva", size=50):
+    """ Access to a system font, initializing the font module of pygame at the first call
+
+    Args:
+        name (str, optional): name of the font. Defaults to "geneva".
+        size (int, optional): size of the font. Defaults to 50.
+
+    Returns:
+        pygame.font.Font: font
+    """
+    if (name, size) not in FONT_CACHE:
+        pygame.font.init()
+        FONT_CACHE[(name, size)] = pygame.font.SysFont(name, size)
+    return FONT_CACHE[(name, size)]
     
 
 def draw_dashed_line(display, color, start_pos, end_pos, width=1, dash_length=10):
@@ -60,6 +79,20 @@ def draw_background(display):
     draw_dashed_line(display , Setup.WHITE, (Setup.WIDTH//2, center_y+dist_center), (Setup.WIDTH//2, Setup.HEIGHT), width = 2, dash_length=10)
 
 
+@lru_cache(maxsize=None)
+def background_surface():
+    """ Surface with the static layout of the screen (road, grass and lines), drawn the first time it is needed
+        and then blitted at each frame (it must not be modified)
+
+    Returns:
+        pygame.Surface: background of the screen
+    """
+    surface = pygame.Surface((Setup.WIDTH, Setup.HEIGHT))
+    surface.fill(Setup.GREY)
+    draw_background(surface)
+    return surface
+
+
 def draw_lights(display, lights_dict, yellows):
     """ Method used to draw the lights (implemented as lines), of all possible colors depending on the value store
         in the lights_dict parameter and the list of "yellow" lights
@@ -68,17 +101,23 @@ def draw_lights(display, lights_dict, yellows):
         display (pygame screen): active Pygame screen
         lights_dict (dict): dictionary storing the information about each traffic light (stored in Game)
         yellows (list of str): list of directions for which we are setting a yellow light
+
+    Returns:
+        list of pygame.Rect: areas of the screen covered by the lights
     """
     global dist_center, center_y, center_x
     # Draw red or green light according to their values
-    pygame.draw.line(display , Setup.GREEN if lights_dict["north"] else Setup.RED, (center_x-dist_center, center_y-dist_center), (center_x, center_y-dist_center), width = 1)
-    pygame.draw.line(display , Setup.GREEN if lights_dict["west"] else Setup.RED, (center_x-dist_center, center_y+dist_center), (center_x-dist_center, center_y), width = 1)
-    pygame.draw.line(display , Setup.GREEN if lights_dict["south"] else Setup.RED, (center_x+dist_center, center_y+dist_center), (center_x, center_y+dist_center), width = 1)
-    pygame.draw.line(display , Setup.GREEN if lights_dict["east"] else Setup.RED, (center_x+dist_center, center_y-dist_center), (center_x+dist_center, center_y), width = 1)
+    rects = [
+        pygame.draw.line(display , Setup.GREEN if lights_dict["north"] else Setup.RED, (center_x-dist_center, center_y-dist_center), (center_x, center_y-dist_center), width = 1),
+        pygame.draw.line(display , Setup.GREEN if lights_dict["west"] else Setup.RED, (center_x-dist_center, center_y+dist_center), (center_x-dist_center, center_y), width = 1),
+        pygame.draw.line(display , Setup.GREEN if lights_dict["south"] else Setup.RED, (center_x+dist_center, center_y+dist_center), (center_x, center_y+dist_center), width = 1),
+        pygame.draw.line(display , Setup.GREEN if lights_dict["east"] else Setup.RED, (center_x+dist_center, center_y-dist_center), (center_x+dist_center, center_y), width = 1)
+    ]
     
     # Draw yellow lights
     for dir in yellows:
         draw_yellow(display, dir)
+    return rects
         
 def draw_yellow(display, dir):
     """ Function called in the previous one to draw yellow lights
@@ -98,6 +137,21 @@ def draw_yellow(display, dir):
         pygame.draw.line(display , Setup.YELLOW, (center_x+dist_center, center_y-dist_center), (center_x+dist_center, center_y), width = 1)
         
 
+@lru_cache(maxsize=64)
+def text_surface(text, font, color):
+    """ Surface of a text, rendered only the first time it is needed (scores change at most once per frame)
+
+    Args:
+        text (str): string to be visualized on the screen
+        font (pygame font): font to use to draw down characters
+        color (tuple): RGB color to use in the plotting
+
+    Returns:
+        pygame.Surface: rendered text (it must not be modified)
+    """
+    return font.render(text, True, color)
+
+
 def draw_text(display, text, font, pos, color):
     """ Method used to draw text on the active pygame screen using a pygame initialized font
 
@@ -107,9 +161,11 @@ def draw_text(display, text, font, pos, color):
         font (pygame font): font to use to draw down characters
         pos (tuple): x and y coordinates for top-left of the string
         color (tuple): RGB color to use in the plotting
+
+    Returns:
+        pygame.Rect: area of the screen covered by the text
     """
-    text_surface = font.render(text, True, color)
-    display.blit(text_surface, pos)
+    return display.blit(text_surface(text, font, color), pos)
 
 def draw_score(display, score, font, color):
     """ Function that calls the function above, by passing the required arguments
@@ -133,8 +189,90 @@ def draw_all(display, lights_dict, score, num_cars, yellows=[]):
         num_cars (int): number of cars generated on the screen since the beginning of the game
         yellows (list, optional): list of directions whose light has to be set to yellow if any. Defaults to [].
     """
-    display.fill(Setup.GREY) # Fill the screen with black
-    draw_background(display)
+    display.blit(background_surface(), (0, 0))
     draw_lights(display, lights_dict, yellows)
-    draw_score(display, score, Setup.geneva50, Setup.BLACK)
-    draw_text(display, f"Cars past: {num_cars}", Setup.geneva50, (50, 100), Setup.BLACK)
+    draw_score(display, score, get_font(), Setup.BLACK)
+    draw_text(display, f"Cars past: {num_cars}", get_font(), (50, 100), Setup.BLACK)
+
+
+class Renderer:
+    """ Incremental drawing of the screen, used for human rendering. Only the areas that changed since the previous
+        frame are drawn again (cars that moved, appeared or left, lights and texts whose values changed), and they
+        are returned as a list of dirty rects for pygame.display.update
+    """
+
+    def __init__(self):
+        # rect of each car drawn at the previous frame
+        self.car_rects = {}
+        # lights (values and yellow lights) drawn at the previous frame, with their areas on the screen
+        self.lights = None
+        self.light_rects = []
+        # text drawn at each position, with its area on the screen
+        self.texts = {}
+
+    def draw(self, display, game, yellows=[]):
+        """ Draws the current frame of the game on the screen, the first call draws the whole screen
+
+        Args:
+            display (pygame screen): active Pygame screen
+            game (Game): game to draw
+            yellows (list, optional): list of directions whose light has to be set to yellow if any. Defaults to [].
+
+        Returns:
+            list of pygame.Rect: areas of the screen that changed
+        """
+        background = background_surface()
+        cars = {car: car.rect.copy() for _, group in game.cars_dict.items() for car in group}
+        lights = (tuple(game.lights_dict.items()), tuple(yellows))
+        texts = {(50, 50): f"Score: {game.score}", (50, 100): f"Cars past: {game.number_cars}"}
+        surfaces = {pos: text_surface(text, get_font(), Setup.BLACK) for pos, text in texts.items()}
+
+        # areas to draw again: old and new positions of the cars that changed, the lights and texts that changed
+        if self.lights is None:
+            areas = [display.get_rect()]
+        else:
+            areas = [rect for car, rect in self.car_rects.items() if cars.get(car) != rect]
+            areas += [rect for car, rect in cars.items() if self.car_rects.get(car) != rect]
+        redraw_lights = lights != self.lights
+        if redraw_lights:
+            areas += self.light_rects
+        redraw_texts = {pos for pos, text in texts.items() if self.texts.get(pos, (None,))[0] != text}
+        for pos in redraw_texts:
+            areas.append(surfaces[pos].get_rect(topleft=pos))
+            if pos in self.texts:
+                areas.append(self.texts[pos][1])
+
+        # images have transparent pixels, everything that overlaps these areas is drawn again as well
+        # (on the background), until no other element is affected
+        redraw_cars = {car for car, rect in cars.items() if self.car_rects.get(car) != rect}
+        grown = True
+        while grown:
+            grown = False
+            if not redraw_lights and any(rect.collidelist(areas) >= 0 for rect in self.light_rects):
+                redraw_lights = grown = True
+                areas += self.light_rects
+            for pos, (_, rect) in self.texts.items():
+                if pos not in redraw_texts and rect.collidelist(areas) >= 0:
+                    redraw_texts.add(pos)
+                    areas.append(rect)
+                    grown = True
+            for car, rect in cars.items():
+                if car not in redraw_cars and rect.collidelist(areas) >= 0:
+                    redraw_cars.add(car)
+                    areas.append(rect)
+                    grown = True
+
+        # restore the background and draw the elements in the same order as draw_all
+        for rect in areas:
+            display.blit(background, rect, rect)
+        if redraw_lights:
+            self.lights = lights
+            self.light_rects = draw_lights(display, game.lights_dict, yellows)
+            areas += self.light_rects
+        for pos in redraw_texts:
+            self.texts[pos] = (texts[pos], display.blit(surfaces[pos], pos))
+        for car in cars:
+            if car in redraw_cars:
+                car.draw(display)
+        self.car_rects = cars
+        return areas
@@ -0,0 +1,861 @@
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from traffic_control_game.envs.logic import Setup, NUDGES, initial_position, car_size
+
+
+# Macro variables
+# distance along the lane below which a car stops behind the next one (same rule as Car.check_next_car)
+STOP_DISTANCE = 1.18*Setup.CAR_HEIGHT
+# ranges of travelled distance stored for each car (see lane_geometry), with their column in HeadlessGame.bounds
+BOUNDS = ["box", "light", "yellow", "screen", "near"]
+BOX, LIGHT, YELLOW, SCREEN, NEAR = [2*i for i in range(len(BOUNDS))]
+# ranges whose boundaries are events for a driving car (see BatchGame.frames_to_event), and a distance never reached
+EVENTS = [SCREEN, LIGHT, BOX, NEAR]
+NEVER = np.iinfo(np.int64).max
+# state of a BatchGame (see BatchGame.snapshot): copies of the arrays of the cars and of the games
+BatchState = namedtuple("BatchState", ["lane", "pos", "driving", "waiting_time", "pass_intersection", "bounds",
+                                       "scores", "cars_added", "red_lanes"])
+# state of a HeadlessGame: state of the arrays, lights and manual switches
+HeadlessState = namedtuple("HeadlessState", ["batch", "lights", "lights_switched"])
+
+
+def advance_lanes(lane, pos, driving, waiting_time, pass_intersection, bounds, red_lanes, moving, speed):
+    """ One frame of the cars of BatchGame, in a single pass over the cars (sorted by lane, in order of arrival):
+        the moving cars move forward, then cars stop at red lights and behind the car in front of them.
+        Same results as BatchGame.move_cars(moving), .check_lights() and .stop_behind_car(), the arrays are updated
+        in place. Compiled with Numba when it is installed (see lane_kernel)
+
+    Args:
+        lane, pos, driving, waiting_time, pass_intersection, bounds: arrays of the cars of BatchGame
+        red_lanes (np.array): lights of each lane of BatchGame (red is True)
+        moving (np.array): boolean mask of the cars to move (can be driving itself)
+        speed (int): distance travelled by a moving car
+    """
+    for car in range(len(lane)):
+        if moving[car]:
+            pos[car] += speed
+            waiting_time[car] = 0
+            # cars that moved inside the intersection have passed it
+            if bounds[car, BOX] <= pos[car] <= bounds[car, BOX+1]:
+                pass_intersection[car] = True
+        # the car in front of it has already moved
+        stop = red_lanes[lane[car]] and bounds[car, LIGHT] <= pos[car] <= bounds[car, LIGHT+1]
+        if car > 0 and lane[car] == lane[car-1] and not pass_intersection[car]:
+            stop = stop or abs(pos[car-1] - pos[car]) <= STOP_DISTANCE
+        driving[car] = not stop
+
+
+@lru_cache(maxsize=None)
+def lane_kernel():
+    """ Compiled version of advance_lanes. Numba is optional and slow to import: it is only imported (and the
+        kernel compiled, cached on disk) by the first game advancing its cars with the kernel (see BatchGame.advance)
+
+    Returns:
+        function: compiled advance_lanes, None if Numba is not installed
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba.njit(cache=True)(advance_lanes)
+
+
+def point_interval(start, sign, low, high):
+    """ Range of travelled distances s for which the coordinate start + sign*s lies in [low, high)
+        (the same half-open convention used by pygame for rects)
+
+    Returns:
+        tuple: first and last distance (both included) satisfying the condition
+    """
+    if sign > 0:
+        return low - start, high - 1 - start
+    return start - high + 1, start - low
+
+
+def rect_interval(start, sign, length, low, high):
+    """ Range of travelled distances s for which a rect of the given length, centered at start + sign*s,
+        overlaps the segment [low, high)
+
+    Returns:
+        tuple: first and last distance (both included) satisfying the condition
+    """
+    return point_interval(start, sign, low - length + length//2 + 1, high + length//2)
+
+
+def conflict_zones(geometry):
+    """ Precomputes where the cars of two perpendicular lanes can collide. Two rects overlap if and only if
+        each car overlaps the strip covered by the other lane, which only depends on its own travelled distance.
+        Lanes of the same axis never overlap (they are on different sides of the road)
+
+    Args:
+        geometry (dict): lane arrays computed in lane_geometry
+
+    Returns:
+        np.array: array of shape (n_lanes, n_lanes, 2, 2), where [a, b, 0] is the range of distances in which a car
+                  of lane a overlaps the strip of lane b, and [a, b, 1] the part of this range inside the intersection
+    """
+    n_lanes = len(geometry["dir"])
+    conflict = np.tile([1, 0], (n_lanes, n_lanes, 2, 1))
+    length = np.where(geometry["axis"] == 0, geometry["width"], geometry["height"])
+    side = np.where(geometry["axis"] == 0, geometry["height"], geometry["width"])
+    for a in range(n_lanes):
+        for b in range(n_lanes):
+            if geometry["axis"][a] == geometry["axis"][b]:
+                assert (geometry["dir"][a] == geometry["dir"][b] or
+                        abs(geometry["cross"][a] - geometry["cross"][b]) >= side[a]), "parallel lanes overlapping"
+                continue
+            strip = geometry["cross"][b] - side[b]//2
+            low, high = rect_interval(geometry["start"][a], geometry["sign"][a], length[a], strip, strip + side[b])
+            conflict[a, b, 0] = low, high
+            conflict[a, b, 1] = max(low, geometry["box"][a][0]), min(high, geometry["box"][a][1])
+    return conflict
+
+
+@lru_cache(maxsize=None)
+def lane_geometry(dirs):
+    """ Precomputes, for every traffic lane, the ranges of travelled distance in which a car is
+        at the intersection, at the light, in the stopping area or still on screen.
+        Lane l is the lane of direction dirs[l//2] obtained with the nudge NUDGES[l%2].
+        "near" is the range in which the rect of a car overlaps the intersection area
+
+    Args:
+        dirs (tuple of str): directions handled by the game
+
+    Returns:
+        dict: arrays indexed by lane, describing the lanes of the game
+    """
+    screen = (-Setup.CAR_WIDTH, -Setup.CAR_HEIGHT, Setup.WIDTH+2*Setup.CAR_WIDTH, Setup.HEIGHT+2*Setup.CAR_HEIGHT)
+    area = Setup.INTERSECT_AREA
+    geometry = {key: [] for key in ["dir", "axis", "sign", "start", "cross", "width", "height",
+                                    "box", "light", "yellow", "screen", "near"]}
+    empty = (1, 0)
+
+    for dir_index, dir in enumerate(dirs):
+        zone = Setup.STOP_ZONES[dir]
+        width, height = car_size(dir)
+        for nudge in NUDGES:
+            x, y = initial_position(dir, nudge)
+            # axis 0 for cars moving horizontally, 1 for cars moving vertically
+            axis = 0 if dir in ["east", "west"] else 1
+            start, cross = (x, y) if axis == 0 else (y, x)
+            sign = 1 if start == 0 else -1
+            length, side = (width, height) if axis == 0 else (height, width)
+            # [low, high) segments of each rect, along and across the lane
+            along = lambda rect: (rect[0], rect[0]+rect[2]) if axis == 0 else (rect[1], rect[1]+rect[3])
+            across = lambda rect: (rect[1], rect[1]+rect[3]) if axis == 0 else (rect[0], rect[0]+rect[2])
+            left = cross - side//2
+
+            box_lo, box_hi = across(area)
+            box = point_interval(start, sign, *along(area)) if box_lo <= cross < box_hi else empty
+            near = rect_interval(start, sign, length, *along(area)) if (left < box_hi and left+side > box_lo) else empty
+            zone_lo, zone_hi = across(zone)
+            light = rect_interval(start, sign, length, *along(zone)) if (left < zone_hi and left+side > zone_lo) else empty
+            yellow = point_interval(start, sign, *along(zone)) if zone_lo <= cross < zone_hi else empty
+
+            geometry["dir"].append(dir_index)
+            geometry["axis"].append(axis)
+            geometry["sign"].append(sign)
+            geometry["start"].append(start)
+            geometry["cross"].append(cross)
+            geometry["width"].append(width)
+            geometry["height"].append(height)
+            geometry["box"].append(box)
+            geometry["light"].append(light)
+            geometry["yellow"].append(yellow)
+            geometry["screen"].append(rect_interval(start, sign, length, *along(screen)))
+            # cars stopping at a yellow light are the ones that have not reached the intersection yet
+            # (see BatchGame.clear_yellows)
+            assert yellow[1] + 1 == box[0], "the stopping area must end where the intersection begins"
+            geometry["near"].append(near)
+
+    geometry = {key: np.array(value) for key, value in geometry.items()}
+    geometry["conflict"] = conflict_zones(geometry)
+    # all the ranges of a lane side by side, copied for each car when it is created
+    geometry["bounds"] = np.hstack([geometry[key] for key in BOUNDS]).astype(np.int64)
+    # distances at which a car enters and leaves each of the EVENTS ranges (NEVER for empty ranges)
+    low, high = geometry["bounds"][:, EVENTS], geometry["bounds"][:, [column + 1 for column in EVENTS]]
+    edges = np.where((low <= high)[..., None], np.stack([low, high + 1], axis=-1), NEVER)
+    geometry["edges"] = edges.reshape(len(low), -1)
+    return geometry
+
+
+class BatchGame:
+    """ Game without any Pygame sprite, simulating several independent intersections at once.
+        Cars of all the games are stored as a structure of NumPy arrays (one entry per car, grouped by game and
+        lane, and ordered by arrival inside each lane), and all the updates of Game are applied to whole lanes at once.
+        Lane l of game g has the global index g*n_lanes + l, and results are returned as arrays over the games
+    """
+
+    def __init__(self, dirs, n_games=1, jit=True):
+        """ Initialization
+
+        Args:
+            dirs (list of str): list of possible directions, passed by the environment
+            n_games (int, optional): number of intersections simulated together. Defaults to 1.
+            jit (bool, optional): advance the cars with the compiled kernel if Numba is installed (see .advance()).
+                                  Defaults to True.
+        """
+        self.dirs = dirs
+        self.dir_index = {dir: i for i, dir in enumerate(dirs)}
+        self.n_games = n_games
+        self.geometry = lane_geometry(tuple(dirs))
+        self.n_lanes = len(self.geometry["dir"])
+
+        # one entry per car
+        self.lane = np.empty(0, dtype=np.int64)
+        # distance travelled since the car entered the screen
+        self.pos = np.empty(0, dtype=np.int64)
+        self.driving = np.empty(0, dtype=bool)
+        self.waiting_time = np.empty(0, dtype=np.int64)
+        self.pass_intersection = np.empty(0, dtype=bool)
+        # ranges of the lane of each car (one row per car, see BOUNDS)
+        self.bounds = np.empty((0, 2*len(BOUNDS)), dtype=np.int64)
+
+        # one entry per game
+        self.scores = np.zeros(n_games, dtype=np.int64)
+        self.cars_added = np.zeros(n_games, dtype=np.int64)
+        # lights of each lane (red is True), all lights are green at the beginning
+        self.red_lanes = np.zeros(n_games*self.n_lanes, dtype=bool)
+        # events of every lane of every game
+        self.edges = np.tile(self.geometry["edges"], (n_games, 1))
+        # games whose lights can conflict (see .conflicting_games()) and events for the current lights (see
+        # ._lane_edges()), computed again only after a change of the lights (see ._lights_changed())
+        self.conflicts = None
+        self.lane_edges = None
+        # compiled kernel of the lanes, looked up at the first frame (see .advance())
+        self.jit = jit
+        self.kernel = None
+
+    def _between(self, column):
+        """ Checks, for each car, whether its travelled distance is within one of the ranges of its lane
+
+        Args:
+            column (int): column of the range in self.bounds (one of BOX, LIGHT, YELLOW, SCREEN, NEAR)
+
+        Returns:
+            np.array: boolean mask over the cars
+        """
+        return (self.bounds[:, column] <= self.pos) & (self.pos <= self.bounds[:, column+1])
+
+    def _keep(self, mask):
+        """ Keeps only the cars in the given mask
+        """
+        self.lane = self.lane[mask]
+        self.pos = self.pos[mask]
+        self.driving = self.driving[mask]
+        self.waiting_time = self.waiting_time[mask]
+        self.pass_intersection = self.pass_intersection[mask]
+        self.bounds = self.bounds[mask]
+
+    def games_of_cars(self):
+        """ Index of the game of each car
+        """
+        return self.lane // self.n_lanes
+
+    @staticmethod
+    def _groups(keys):
+        """ Groups of equal values in a sorted array
+
+        Args:
+            keys (np.array): sorted array (such as the lanes or the games of the cars)
+
+        Returns:
+            np.array: value of each group
+            np.array: index of the first element of each group
+        """
+        first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        return keys[first], first
+
+    def reset_games(self, games):
+        """ Removes all cars of the given games and sets them back to their initial state
+
+        Args:
+            games (np.array): boolean mask over the games
+        """
+        self._keep(~games[self.games_of_cars()])
+        self.scores[games] = 0
+        self.cars_added[games] = 0
+        self.red_lanes[np.repeat(games, self.n_lanes)] = False
+        self._lights_changed()
+
+    def lane_ids(self, games, dirs, sides):
+        """ Global index of lanes
+
+        Args:
+            games (np.array): index of the game
+            dirs (np.array): index of the direction (in self.dirs)
+            sides (np.array): index of the lane inside the direction (in NUDGES)
+
+        Returns:
+            np.array: global index of the lanes
+        """
+        return games*self.n_lanes + 2*dirs + sides
+
+    def can_add_cars(self, lanes):
+        """ Verifies, for each of the given lanes, if a new car would not overlap with the last car of the lane
+
+        Args:
+            lanes (np.array): global index of the lanes
+
+        Returns:
+            np.array: boolean mask, whether a car can be added in each lane
+        """
+        if len(self.lane) == 0:
+            return np.ones(len(lanes), dtype=bool)
+        last = np.maximum(np.searchsorted(self.lane, lanes, side="right") - 1, 0)
+        has_last = self.lane[last] == lanes
+        return ~has_last | (self.pos[last] >= Setup.CAR_HEIGHT)
+
+    def add_cars(self, lanes):
+        """ Adds a new car at the end of each of the given lanes (the last car of the lane becomes its next car)
+
+        Args:
+            lanes (np.array): global index of the lanes, without duplicates
+        """
+        if len(lanes) == 0:
+            return
+        lanes = np.sort(lanes)
+        # position of the new cars once inserted, the other cars keep their order
+        new = np.searchsorted(self.lane, lanes, side="right") + np.arange(len(lanes))
+        old = np.ones(len(self.lane) + len(lanes), dtype=bool)
+        old[new] = False
+
+        def insert(array, values):
+            res = np.empty((len(old), *array.shape[1:]), dtype=array.dtype)
+            res[old] = array
+            res[new] = values
+            return res
+
+        self.lane = insert(self.lane, lanes)
+        self.pos = insert(self.pos, 0)
+        self.driving = insert(self.driving, True)
+        self.waiting_time = insert(self.waiting_time, 0)
+        self.pass_intersection = insert(self.pass_intersection, False)
+        self.bounds = insert(self.bounds, self.geometry["bounds"][lanes % self.n_lanes])
+        np.add.at(self.cars_added, lanes // self.n_lanes, 1)
+
+    def set_lights(self, phases, games=None):
+        """ Sets the traffic lights of the given games
+
+        Args:
+            phases (np.array): boolean array of shape (n_games, n_dirs), whether each light is green
+            games (np.array, optional): boolean mask of the games to update. Defaults to all games.
+        """
+        red_lanes = ~np.repeat(phases, 2, axis=1).ravel()
+        if games is None:
+            self.red_lanes = red_lanes
+        else:
+            lanes = np.repeat(games, self.n_lanes)
+            self.red_lanes[lanes] = red_lanes[lanes]
+        self._lights_changed()
+
+    def move_cars(self, moving=None, frames=1):
+        """ Move all cars that are driving (or only the ones in the given mask)
+
+        Args:
+            moving (np.array, optional): boolean mask of the cars to move. Defaults to the driving cars.
+            frames (int, optional): number of frames the cars move for, without any event in between
+                                    (see .frames_to_event()). Defaults to 1.
+        """
+        if moving is None:
+            moving = self.driving
+        self.pos[moving] += frames*Setup.CAR_SPEED
+        # every time a car moves, waiting time is reset to 0
+        self.waiting_time[moving] = 0
+        # cars that moved inside the intersection have passed it
+        self.pass_intersection |= moving & self._between(BOX)
+
+    def advance(self, moving=None):
+        """ One frame of the cars: same as .move_cars(moving), .check_lights() and .stop_behind_car(), computed in
+            a single compiled call over all the lanes of all the games when the kernel is available
+
+        Args:
+            moving (np.array, optional): boolean mask of the cars to move. Defaults to the driving cars.
+        """
+        if self.jit:
+            self.kernel, self.jit = lane_kernel(), False
+        if self.kernel is None:
+            self.move_cars(moving)
+            self.check_lights()
+            self.stop_behind_car()
+            return
+        self.kernel(self.lane, self.pos, self.driving, self.waiting_time, self.pass_intersection, self.bounds,
+                    self.red_lanes, self.driving if moving is None else moving, Setup.CAR_SPEED)
+
+    def check_lights(self):
+        """ Cars are free to go if their light is green, and stop in the stopping area if it is red
+        """
+        self.driving = ~(self.red_lanes[self.lane] & self._between(LIGHT))
+
+    def clear_yellows(self, yellows, max_frames=Setup.YELLOW_MAX_FRAMES):
+        """ Lets the cars of the directions turning red clear the intersection, with the same result as calling
+            HeadlessGame.move_at_yellow(), .stop_behind_car() and .update_scores() as long as
+            HeadlessGame.check_at_yellow() (at most max_frames times), computed in a single update.
+            The yellow lights last until the last car of those directions inside the intersection leaves it.
+            Meanwhile, each driving car moves until it reaches the stopping area of its direction, or until it gets
+            too close to the car in front of it (which moves in the same way) if it has not passed the intersection.
+            Cars that have not passed the intersection stop at the light before they can reach it (the stopping area
+            ends where the intersection begins), so that a car in front of them has a lower or equal number of moves
+
+        Args:
+            yellows (np.array): boolean array of shape (n_games, n_dirs), directions that switched from green to red
+            max_frames (int, optional): maximum duration of the yellow lights. Defaults to Setup.YELLOW_MAX_FRAMES.
+
+        Returns:
+            np.array: number of frames of yellow light of each game
+        """
+        speed = Setup.CAR_SPEED
+        never = max_frames + 1
+        games = self.games_of_cars()
+        # duration of the yellow lights: cars inside the intersection leave it without stopping
+        # (a car that is not driving would block it forever, the duration is capped)
+        clearing = np.repeat(yellows, 2, axis=1).ravel()[self.lane] & self._between(BOX)
+        exits = np.where(self.driving, -(-(self.bounds[:, BOX+1] + 1 - self.pos) // speed), never)
+        frames = np.zeros(self.n_games, dtype=np.int64)
+        np.maximum.at(frames, games[clearing], exits[clearing])
+        frames = np.minimum(frames, max_frames)
+        if not frames.any():
+            return frames
+
+        # moves before reaching the stopping area (the car does not move anymore once its center is inside)
+        low, high = self.bounds[:, YELLOW], self.bounds[:, YELLOW+1]
+        to_light = -(-(low - self.pos) // speed)
+        to_light = np.where((low <= high) & (self.pos <= high), np.maximum(to_light, 0), never)
+        own = np.where(self.driving, np.minimum(frames[games], to_light), 0)
+
+        # a driving car that has not passed the intersection stops behind the car in front of it (which made
+        # moves[ahead] moves) after gap[car] + moves[ahead] moves, the number of moves of each car is then
+        # moves[car] = min(own[car], gap[car] + moves[ahead]), computed with a cumulative minimum on each chain
+        # of consecutive cars following each other
+        start = np.ones(len(self.lane), dtype=bool)
+        start[1:] = (self.lane[1:] != self.lane[:-1]) | self.pass_intersection[1:] | ~self.driving[1:]
+        gap = np.zeros(len(self.lane), dtype=np.int64)
+        gap[1:] = -(-(np.abs(self.pos[:-1] - self.pos[1:]) - int(STOP_DISTANCE)) // speed)
+        gap[start] = 0
+        chain = np.cumsum(start) - 1
+        total = np.cumsum(gap)
+        total -= total[np.flatnonzero(start)][chain]
+        values = own - total
+        offset = chain*(values.max() - values.min() + 1)
+        moves = np.minimum.accumulate(values - offset) + offset + total
+        stopped = np.zeros(len(self.lane), dtype=bool)
+        stopped[1:] = ~start[1:] & (gap[1:] + moves[:-1] <= own[1:])
+
+        # cars that moved inside the intersection have passed it
+        box_low, box_high = self.bounds[:, BOX], self.bounds[:, BOX+1]
+        self.pass_intersection |= (moves > 0) & (self.pos + speed <= box_high) & (self.pos + moves*speed >= box_low)
+        self.pos += moves*speed
+        self.waiting_time[moves > 0] = 0
+        self.driving &= ~stopped
+        self.update_scores()
+        return frames
+
+    def stop_behind_car(self):
+        """ Driving cars that have not passed the intersection stop if they are too close to the car in
+            front of them in the same lane
+        """
+        close = ((self.lane[1:] == self.lane[:-1]) & (~self.pass_intersection[1:])
+                 & (np.abs(self.pos[:-1] - self.pos[1:]) <= STOP_DISTANCE))
+        self.driving[1:] &= ~close
+
+    def frames_to_event(self):
+        """ Number of frames before the state of each game changes in another way than the driving cars moving
+            forward: a car reaching or leaving the stopping area of a red light, the intersection or the screen,
+            a car getting close enough to the car in front of it to stop or far enough to go, a waiting car
+            starting to move, or a car moving inside the intersection area while crossing roads have green
+            lights (where it could crash).
+            Arrivals are not taken into account. The driving state of the cars must be up to date
+            (as after .stop_behind_car())
+
+        Returns:
+            np.array: for each game, first frame at which an event can happen (frames before it can be
+                      skipped with .move_cars(frames=...)), NEVER if nothing can happen
+        """
+        speed = Setup.CAR_SPEED
+        if len(self.lane) == 0:
+            return np.full(self.n_games, NEVER)
+        edges = self._lane_edges()[self.lane]
+        # passing the intersection only matters once
+        edges[self.pass_intersection, 4:6] = NEVER
+        ahead = edges - self.pos[:, None]
+        # cars can crash as soon as they move inside the intersection area, cars that start driving
+        # reset their waiting time when they move
+        now = (ahead[:, 6] <= 0) & (ahead[:, 7] > 0) | (self.waiting_time > 0)
+        ahead[ahead <= 0] = NEVER
+        frames = -(-ahead.min(axis=1) // speed)
+        frames[now] = 1
+        frames[~self.driving] = NEVER
+
+        # pairs of consecutive cars of a lane in which only one car is moving (the distance between them changes)
+        behind = frames[1:]
+        following = (self.lane[1:] == self.lane[:-1]) & ~self.pass_intersection[1:]
+        gap = np.abs(self.pos[:-1] - self.pos[1:])
+        limit = int(STOP_DISTANCE)
+        closing = following & ~self.driving[:-1] & self.driving[1:]
+        behind[closing] = np.minimum(behind[closing], -(-(gap[closing] - limit) // speed))
+        opening = following & self.driving[:-1] & ~self.driving[1:] & (gap <= limit)
+        behind[opening] = np.minimum(behind[opening], (limit - gap[opening]) // speed + 1)
+
+        if self.n_games == 1:
+            return frames.min(keepdims=True)
+        res = np.full(self.n_games, NEVER)
+        games, first = self._groups(self.games_of_cars())
+        res[games] = np.minimum.reduceat(frames, first)
+        return res
+
+    def _lights_changed(self):
+        """ Discards the values computed for the previous lights (see .conflicting_games() and ._lane_edges()),
+            called by every change of the lights
+        """
+        self.conflicts = None
+        self.lane_edges = None
+
+    def _lane_edges(self):
+        """ Events of every lane of every game for the current lights, computed again only when the lights change:
+            the stopping area only matters for red lights, the intersection area only if crossing roads have green
+            lights (see .frames_to_event())
+
+        Returns:
+            np.array: array of shape (n_games*n_lanes, len(EVENTS)*2), distances of the events, NEVER if disabled
+        """
+        if self.lane_edges is None:
+            conflicting = np.zeros(self.n_games, dtype=bool)
+            conflicting[self.conflicting_games()] = True
+            edges = self.edges.copy()
+            edges[~self.red_lanes, 2:4] = NEVER
+            edges[~np.repeat(conflicting, self.n_lanes), 6:8] = NEVER
+            self.lane_edges = edges
+        return self.lane_edges
+
+    def update_waiting(self):
+        """ Update waiting time of the cars not driving, for the directions with a red light
+        """
+        self.waiting_time[self.red_lanes[self.lane] & ~self.driving] += 1
+
+    def update_scores(self):
+        """ Removes the cars that left the screen, auto-incrementing the score of their game for each of them
+
+        Returns:
+            np.array: updated scores
+        """
+        on_screen = self._between(SCREEN)
+        if not on_screen.all():
+            np.add.at(self.scores, self.games_of_cars()[~on_screen], 1)
+            self._keep(on_screen)
+        return self.scores
+
+    def max_wait_times(self):
+        """ Maximum waiting time among the cars of each game
+
+        Returns:
+            np.array: maximum waiting time of each game (0 without cars)
+        """
+        res = np.zeros(self.n_games, dtype=np.int64)
+        if len(self.lane) > 0:
+            games, first = self._groups(self.games_of_cars())
+            res[games] = np.maximum.reduceat(self.waiting_time, first)
+        return res
+
+    def waiting_counts(self):
+        """ Number of cars that are not driving
+
+        Returns:
+            np.array: array of shape (n_games, n_dirs) with the number of waiting cars of each direction
+        """
+        counts = np.bincount(self.lane[~self.driving] // 2, minlength=self.n_games*len(self.dirs))
+        return counts.reshape(self.n_games, len(self.dirs))
+
+    def _rects(self, index):
+        """ Left, top, width and height of the rects of the given cars
+
+        Args:
+            index (np.array): indices of the cars
+
+        Returns:
+            tuple of np.array: coordinates and dimensions of the rects
+        """
+        g = self.geometry
+        lane = self.lane[index] % self.n_lanes
+        along = g["start"][lane] + g["sign"][lane]*self.pos[index]
+        horizontal = g["axis"][lane] == 0
+        x = np.where(horizontal, along, g["cross"][lane])
+        y = np.where(horizontal, g["cross"][lane], along)
+        width, height = g["width"][lane], g["height"][lane]
+        return x - width//2, y - height//2, width, height
+
+    def lights_can_conflict(self):
+        """ Whether the current lights of each game let cars of crossing roads drive into the intersection.
+            If only one road has green lights, the cars of the other one were cleared by the yellow lights
+            and stop before the intersection, so that no crash can happen
+
+        Returns:
+            np.array: for each game, whether cars of the two roads can be at the intersection at the same time
+        """
+        green = ~self.red_lanes.reshape(self.n_games, self.n_lanes)
+        horizontal = self.geometry["axis"] == 0
+        return (green & horizontal).any(axis=1) & (green & ~horizontal).any(axis=1)
+
+    def conflicting_games(self):
+        """ Games whose lights can conflict (see .lights_can_conflict()), computed again only when the lights change
+
+        Returns:
+            np.array: index of the games
+        """
+        if self.conflicts is None:
+            self.conflicts = np.flatnonzero(self.lights_can_conflict())
+        return self.conflicts
+
+    def _cars_of_games(self, games):
+        """ Cars of the given games (cars are sorted by lane, the cars of a game are contiguous)
+
+        Args:
+            games (np.array): sorted index of the games
+
+        Returns:
+            np.array: indices of the cars, in order
+        """
+        start = np.searchsorted(self.lane, games*self.n_lanes)
+        counts = np.searchsorted(self.lane, (games + 1)*self.n_lanes) - start
+        return np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def crashed_games(self):
+        """ Games in which two cars belonging to different directions are colliding, one of them being at the
+            intersection (using the conflict zones of the lanes). Only the cars of the games whose lights can
+            conflict are checked, nothing is computed when no game can conflict
+
+        Returns:
+            np.array: index of the games with a collision
+        """
+        games = self.conflicting_games()
+        if len(games) == 0 or len(self.lane) < 2:
+            return games[:0]
+        cars = np.arange(len(self.lane)) if len(games) == self.n_games else self._cars_of_games(games)
+        # only cars overlapping the intersection area can collide with another car
+        pos = self.pos[cars]
+        near = cars[(self.bounds[cars, NEAR] <= pos) & (pos <= self.bounds[cars, NEAR+1])]
+        if len(near) < 2:
+            return games[:0]
+        lanes, pos = self.lane[near], self.pos[near]
+        conflict = self.geometry["conflict"][lanes % self.n_lanes]
+        inside = (conflict[..., 0] <= pos[:, None, None]) & (pos[:, None, None] <= conflict[..., 1])
+        # for each lane, whether a car is in the conflict zone with each other lane (cars are sorted by lane),
+        # only for the games with cars near their intersection
+        games, local = np.unique(lanes // self.n_lanes, return_inverse=True)
+        lanes, first = self._groups(local*self.n_lanes + lanes % self.n_lanes)
+        occupied = np.zeros((len(games)*self.n_lanes, self.n_lanes, 2), dtype=bool)
+        occupied[lanes] = np.logical_or.reduceat(inside, first, axis=0)
+        occupied = occupied.reshape(len(games), self.n_lanes, self.n_lanes, 2)
+        facing = occupied.transpose(0, 2, 1, 3)
+        collisions = (occupied[..., 1] & facing[..., 0]) | (occupied[..., 0] & facing[..., 1])
+        return games[collisions.any(axis=(1, 2))]
+
+    def crashes(self):
+        """ Checks, for each game, if two cars belonging to different directions are colliding (see
+            .crashed_games())
+
+        Returns:
+            np.array: for each game, whether a collision has happened
+        """
+        res = np.zeros(self.n_games, dtype=bool)
+        res[self.crashed_games()] = True
+        return res
+
+    def snapshot(self):
+        """ State of all the games, that can be restored any number of times (see .restore())
+
+        Returns:
+            BatchState: copies of the arrays of the cars and of the games
+        """
+        return BatchState(*(getattr(self, name).copy() for name in BatchState._fields))
+
+    def restore(self, state):
+        """ Sets the games back to a state returned by .snapshot() (the state itself is not modified)
+
+        Args:
+            state (BatchState): state of a BatchGame with the same directions and number of games
+        """
+        for name, array in zip(BatchState._fields, state):
+            setattr(self, name, array.copy())
+        self._lights_changed()
+
+
+class HeadlessGame(BatchGame):
+    """ Single intersection of BatchGame, with the same interface as Game. It is used when the environment
+        is not rendered: the dynamics are exactly the ones of Game, so that the same seed leads to the same episode.
+    """
+
+    def __init__(self, dirs):
+        """ Initialization
+
+        Args:
+            dirs (list of str): list of possible directions, passed by the environment
+        """
+        super().__init__(dirs, n_games=1)
+        self.lights_dict = {dir: True for dir in dirs}
+        # manual switches of the lights (see .switch_light()) skip the yellow lights
+        self.lights_switched = False
+
+    @property
+    def score(self):
+        return int(self.scores[0])
+
+    @property
+    def number_cars(self):
+        return int(self.cars_added[0])
+
+    def add_car(self, dir, side, image=None):
+        """ Method used to add a new car in a specified direction, if its lane is not full
+
+        Args:
+            dir (str): direction for which we want a new car
+            side (int): traffic lane of the car, index of its nudge in NUDGES
+            image (str, optional): image of the car, not used without sprites
+        """
+        lane = self.lane_ids(np.array([0]), np.array([self.dir_index[dir]]), np.array([side]))
+        if not self.can_add_cars(lane)[0]:
+            return
+        self.add_cars(lane)
+
+    def clear_yellow(self, yellows):
+        """ Lets the cars of the directions turning red clear the intersection (see BatchGame.clear_yellows)
+
+        Args:
+            yellows (list of str): list of directions that switched from green to red
+
+        Returns:
+            int: number of frames of yellow light
+        """
+        return int(self.clear_yellows(np.array([[dir in yellows for dir in self.dirs]]))[0])
+
+    def set_light(self, dir, value):
+        """ Access method to set the traffic light of the specified direction to a specified value
+
+        Args:
+            dir (str): direction, to identify the corresponding light
+            value (bool): whether to light it up (green) or not (red)
+        """
+        self.lights_dict[dir] = value
+        self.red_lanes[2*self.dir_index[dir]:2*self.dir_index[dir]+2] = not value
+        self._lights_changed()
+
+    def switch_light(self, dir):
+        """ Method used to switch the color of the traffic light of the specified direction
+
+        Args:
+            dir (str): specified direction to identify the corresponding traffic light
+        """
+        self.set_light(dir, not self.lights_dict[dir])
+        self.lights_switched = True
+        self._lights_changed()
+
+    def get_lights(self):
+        """ Get method to access the dictionary of light values
+
+        Returns:
+            dict: dictionary storing the values of each traffic light
+        """
+        return self.lights_dict
+
+    def max_wait_time(self):
+        """ Method to access the maximum waiting time among the cars on the screen
+
+        Returns:
+            int: maximum waiting time across all the cars on the screen
+        """
+        return int(self.waiting_time.max()) if len(self.waiting_time) > 0 else 0
+
+    def waiting_cars(self):
+        """ Method to access the number of cars that are not driving
+
+        Returns:
+            dict: number of waiting cars for each direction
+        """
+        counts = self.waiting_counts()[0]
+        return {dir: int(counts[i]) for i, dir in enumerate(self.dirs)}
+
+    def waiting_stats(self):
+        """ Number of waiting cars and maximum waiting time at once, as needed by the environment at every frame
+            (each one computed with a single pass over the cars, without building a dictionary)
+
+        Returns:
+            list of int: number of waiting cars for each direction, in the order of dirs
+            int: maximum waiting time across all the cars on the screen
+        """
+        if len(self.lane) == 0:
+            return [0]*len(self.dirs), 0
+        counts = np.bincount(self.lane[~self.driving] // 2, minlength=len(self.dirs))
+        return counts.tolist(), int(self.waiting_time.max())
+
+    def check_at_yellow(self, yellows):
+        """ Checks whether in any of the specified directions there are cars still at the intersection
+
+        Args:
+            yellows (list of str): list of directions that switched from green to red
+
+        Returns:
+            bool: whether there is at least one car still at the intersection, to be waited for
+        """
+        mask = np.repeat([dir in yellows for dir in self.dirs], 2)
+        return bool((mask[self.lane] & self._between(BOX)).any())
+
+    def move_at_yellow(self):
+        """ Move the cars that are driving and whose center is not in the stopping area of their direction
+        """
+        self.move_cars(self.driving & ~self._between(YELLOW))
+
+    def lights_can_conflict(self):
+        """ Same as BatchGame.lights_can_conflict(), always True after a manual switch of the lights
+        """
+        return super().lights_can_conflict() | self.lights_switched
+
+    def check_crash(self):
+        """ Function that checks if two cars belonging to different directions are colliding.
+            Lights that cannot conflict skip the check, without looking at the cars (see BatchGame.crashed_games())
+
+        Returns:
+            bool: whether a collision has happened on the screen or not
+        """
+        return len(self.crashed_games()) > 0
+
+    def update_score(self):
+        """ Removes the cars that left the screen, auto-incrementing the score for each of them
+
+        Returns:
+            int: updated score
+        """
+        self.update_scores()
+        return self.score
+
+    def cars_on_screen(self):
+        """ Get function to return whether any car is present on the screen or not
+
+        Returns:
+            bool: specifying this condition
+        """
+        return len(self.lane) > 0
+
+    def reset_score(self):
+        """ Sets the score back to 0, the cars on the screen are counted as the only cars added
+        """
+        self.cars_added -= self.scores
+        self.scores[:] = 0
+
+    def snapshot(self):
+        """ State of the game, that can be restored any number of times (see .restore())
+
+        Returns:
+            HeadlessState: arrays of the cars, lights and manual switches
+        """
+        return HeadlessState(super().snapshot(), tuple(self.lights_dict.items()), self.lights_switched)
+
+    def restore(self, state):
+        """ Sets the game back to a state returned by .snapshot()
+
+        Args:
+            state (HeadlessState): state of a HeadlessGame with the same directions
+        """
+        super().restore(state.batch)
+        self.lights_dict.update(state.lights)
+        self.lights_switched = state.lights_switched
+        self._lights_changed()
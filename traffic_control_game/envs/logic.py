@@ -1,4 +1,6 @@
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
+from functools import lru_cache
+from itertools import islice
 import pygame
 import math
 import numpy as np
@@ -9,13 +11,79 @@ import math
 
 
 
-# Initialization of pygame
-pygame.font.init()
-
 # Macro variables
-IMAGE_DIR = "img"
-IMAGES = os.listdir(IMAGE_DIR)
+# car images are shipped with the package (independent of the working directory)
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "img")
 ANGLES = {"south": 0, "north": 180, "east": 90, "west": 270}
+MOVEMENTS = {"north": (0, 1), "south": (0, -1), "east": (-1, 0), "west": (1, 0)}
+# car images, loaded from disk, scaled and rotated only once and shared by all the cars (see car_image)
+IMAGE_CACHE = {}
+# state of a Game (see Game.snapshot): cars as tuples (direction, center, image, driving, waiting time, passed the
+# intersection) in the order of the sprite groups, cars of each lane as indices in this tuple, lights and scores
+GameState = namedtuple("GameState", ["cars", "lanes", "lights", "lights_switched", "score", "number_cars"])
+
+
+def initial_position(direction, nudge):
+    """ Coordinates at which a car enters the screen, for a given direction and traffic lane
+
+    Args:
+        direction (str): direction of the car
+        nudge (float): displacement identifying the traffic lane (+/- Setup.NUDGE)
+
+    Returns:
+        tuple: 2-d coordinates of the center of the car at its creation
+    """
+    dist_center = Setup.DIST_CENTER
+    center_x, center_y = Setup.CENTER_X, Setup.CENTER_Y
+    width, height = Setup.WIDTH, Setup.HEIGHT
+
+    initial_pos = {"north": (center_x-dist_center/2-nudge, 0), "south": (center_x+dist_center/2-nudge, height),
+                   "east": (width, center_y-dist_center/2-nudge), "west": (0, center_y+dist_center/2-nudge)}
+    return initial_pos[direction]
+
+
+def car_size(direction):
+    """ Size of the rect of a car on the screen, once its image is rotated according to the direction
+
+    Args:
+        direction (str): direction of the car
+
+    Returns:
+        tuple: width and height of the rect
+    """
+    if ANGLES[direction] % 180 == 0:
+        return Setup.CAR_WIDTH, Setup.CAR_HEIGHT
+    return Setup.CAR_HEIGHT, Setup.CAR_WIDTH
+
+
+@lru_cache(maxsize=None)
+def image_names():
+    """ File names of the car images in IMAGE_DIR, listed the first time they are needed
+
+    Returns:
+        list of str: sorted file names (the environment draws an index in this list for each new car)
+    """
+    return sorted(os.listdir(IMAGE_DIR))
+
+
+def car_image(name, direction):
+    """ Access to the image of a car, scaled to the size of the cars and rotated according to the direction.
+        The first time an image is requested it is loaded and prepared for the four directions, the same
+        surface is then shared by all the cars (it must not be modified)
+
+    Args:
+        name (str): file name of the image in IMAGE_DIR
+        direction (str): direction of the car
+
+    Returns:
+        pygame.Surface: image of the car
+    """
+    if (name, direction) not in IMAGE_CACHE:
+        image = pygame.image.load(os.path.join(IMAGE_DIR, name))
+        image = pygame.transform.scale(image, (Setup.CAR_WIDTH, Setup.CAR_HEIGHT))
+        for dir, angle in ANGLES.items():
+            IMAGE_CACHE[(name, dir)] = pygame.transform.rotate(image, angle)
+    return IMAGE_CACHE[(name, direction)]
 
 
 def get_movement(direction):
@@ -30,21 +98,11 @@ def get_movement(direction):
         tuple: basis vector for direction
         Point: 2-d coordinates determining the center of the rect for a car
     """
-    dist_center = Setup.DIST_CENTER
-    center_x, center_y = Setup.CENTER_X, Setup.CENTER_Y
-    width, height = Setup.WIDTH, Setup.HEIGHT
-
-    movements = {"north": (0, 1), "south": (0, -1), "east": (-1, 0), "west": (1, 0)}
-    
     # random choice between two possible distances (for the two traffic lanes)
-    nudg_o, nudg_e = Setup.NUDGE, - Setup.NUDGE
-    nudges = [nudg_o, nudg_e]
-    
     # initial positions (later moved using the basis vector of movement)
-    initial_pos = {"north": (center_x-dist_center/2-np.random.choice(nudges), 0), "south": (center_x+dist_center/2-np.random.choice(nudges), height),
-                   "east": (width, center_y-dist_center/2-np.random.choice(nudges)), "west": (0, center_y+dist_center/2-np.random.choice(nudges))}
+    initial_pos = {dir: initial_position(dir, np.random.choice(NUDGES)) for dir in ["north", "south", "east", "west"]}
     
-    return movements[direction], Point(initial_pos[direction])
+    return MOVEMENTS[direction], Point(initial_pos[direction])
 
 
 
@@ -80,6 +138,8 @@ class Setup:
     CAR_HEIGHT = 20
     CAR_WIDTH = 12
     CAR_SPEED = 1
+    # Maximum number of frames of yellow lights, enough for any car to drive through the intersection
+    YELLOW_MAX_FRAMES = -(-2*DIST_CENTER // CAR_SPEED)
     # Maximum number of cars waiting, defining the boundaries of the observation space
     MAX_CARS_NS = 2*((CENTER_Y - DIST_CENTER)//CAR_HEIGHT + 1) 
     MAX_CARS_WE = 2*((CENTER_X - DIST_CENTER)//CAR_HEIGHT + 1) 
@@ -95,21 +155,43 @@ class Setup:
     # Pygame surface defining the intersection area (to check for collision, during yellow lights for instance)
     INTERSECT_AREA = Rect(CENTER_X-DIST_CENTER, CENTER_Y-DIST_CENTER, 2*DIST_CENTER, 2*DIST_CENTER)
 
-    # Pygame font
-    geneva50 = pygame.font.SysFont("geneva", 50)
-
     def cos_fun(A, T, phi, k):
-        """ Function used at the beginning for car generation (thought of defining different arrival rates)
-            Not used eventually
+        """ Time-varying demand: multiplier of the arrival probabilities as a function of the frame index, with
+            amplitude A, period T (in frames), phase phi and offset k (see the "demand" option of reset)
+
+        Returns:
+            callable: vectorized function of the frame indices
         """
-        return lambda x: A*math.cos(2*math.pi*x/T + phi)+k
+        return lambda x: A*np.cos(2*math.pi*np.asarray(x)/T + phi)+k
     
     
+def demand_function(demand):
+    """ Time-varying demand given in the "demand" option of reset
+
+    Args:
+        demand (callable, tuple or list): vectorized function of the frame index, or parameters (A, T, phi, k)
+                                          of Setup.cos_fun. None for a constant demand
+
+    Returns:
+        callable: multiplier of the arrival probabilities as a function of the frame index (None if constant)
+    """
+    if demand is None or callable(demand):
+        return demand
+    if isinstance(demand, (tuple, list)) and len(demand) == 4:
+        return Setup.cos_fun(*demand)
+    raise ValueError(f"demand must be a function of the frame index or the parameters (A, T, phi, k) of "
+                     f"Setup.cos_fun, got {demand!r}")
+
+
+# displacements of the two traffic lanes of each direction (a new car enters one of them)
+NUDGES = [Setup.NUDGE, - Setup.NUDGE]
+
 
 class Point:
     """ Class defining the concept of Point, used for collision as well as car movements
         It implements some common point operation such as translation and dot product, useful throughout the game
     """
+    __slots__ = ("x", "y")
 
     def __init__(self, point_t=(0, 0)):
         """ Setting of x and y coordinate
@@ -145,7 +227,7 @@ class Point:
     def dot(self, other):
         """ Dot product between vectors
         """
-        return np.array(self.get()).dot(np.array(other.get()))
+        return self.x*other.x + self.y*other.y
     
     def dist(self, other):
         """ Eucledian distance between points
@@ -159,53 +241,119 @@ class Point:
 
 
 
+class WaitingCars:
+    """ Statistics of the waiting cars of a Game (number of cars not driving and waiting times), updated
+        by the cars themselves when their state changes, so that they are available without scanning the cars
+    """
+
+    def __init__(self, dirs):
+        """ Initialization
+
+        Args:
+            dirs (list of str): list of possible directions
+        """
+        # number of cars not driving in each direction
+        self.counts = {dir: 0 for dir in dirs}
+        # number of cars for each (positive) waiting time, and maximum waiting time
+        self.times = defaultdict(int)
+        self.max_time = 0
+
+    def change_driving(self, dir, driving):
+        """ Called when a car of the given direction starts (driving=True) or stops driving
+        """
+        self.counts[dir] += -1 if driving else 1
+
+    def change_time(self, old, new):
+        """ Called when the waiting time of a car changes from old to new
+        """
+        if old:
+            self.times[old] -= 1
+        if new:
+            self.times[new] += 1
+            self.max_time = max(self.max_time, new)
+        # waiting times only grow by one, the maximum is found by going down from the previous one
+        while self.max_time > 0 and self.times[self.max_time] == 0:
+            self.max_time -= 1
+
+    def remove(self, car):
+        """ Called when a car leaves the screen
+        """
+        if not car.driving:
+            self.change_driving(car.direction, True)
+        self.change_time(car.waiting_time, 0)
+
+
 class Car(pygame.sprite.Sprite):
     """ Class for Car, at the basis of traffic control, handled by a Game instantiation
     """
 
-    def __init__(self, direction="north"):
+    def __init__(self, direction="north", pos=None, waiting=None, image=None):
         # init of superclass Sprite
         super().__init__()
 
         self.direction = direction
-        # get basis vector for direction and initial position
-        self.moving, self.pos = get_movement(direction)
+        # get basis vector for direction and initial position (random traffic lane if not given)
+        if pos is None:
+            self.moving, pos = get_movement(direction)
+        else:
+            self.moving = MOVEMENTS[direction]
         # store useful measures from the Setup class
         self.width = Setup.CAR_WIDTH
         self.height = Setup.CAR_HEIGHT
         self.speed = Setup.CAR_SPEED
+        # displacement of each frame, applied in place to the rect (the kinematic state of the car), and axis of
+        # the lane along which distances to the next car are measured
+        self.step_x, self.step_y = self.moving[0]*self.speed, self.moving[1]*self.speed
+        self.vertical = self.moving[0] == 0
+        self.stop_distance = 1.18*self.height
         # boolean stating whether car moving or not (red light)
         self.driving = True
+        # statistics of the waiting cars (WaitingCars owned by the Game), updated when the car stops, goes or waits
+        self.waiting = waiting
         self.waiting_time = 0
         # reference to the next car are stored for efficiency issues (avoid double loops for checking)
         self.next_car = None
         # once passed the intersection, this attribute is changed to avoid additional checks for stopping
         # (for efficiency issues)
         self.pass_intersection = False
-        # pick a random image from the repertory, scale and rotate it depending on the direction
-        self.image = pygame.image.load(os.path.join(os.getcwd(), IMAGE_DIR, np.random.choice(IMAGES)))
-        self.image = pygame.transform.scale(self.image, (self.width, self.height))
-        self.image = pygame.transform.rotate(self.image, ANGLES[self.direction])
+        # image from the repertory (random if not given), scaled and rotated depending on the direction
+        self.image_name = np.random.choice(image_names()) if image is None else image
+        self.image = car_image(self.image_name, self.direction)
         # set the center of the image (pygame surface) at the initial coordinates
         self.rect = self.image.get_rect()
-        self.rect.center = (self.pos.x, self.pos.y)
+        self.rect.center = (pos.x, pos.y)
+
+    @property
+    def pos(self):
+        """ Coordinates of the center of the car
+
+        Returns:
+            Point: 2-d coordinates of the center of the rect
+        """
+        return Point(self.rect.center)
             
     def check_next_car(self):
         """ Check for the necessity of stopping (hitting the next car in the traffic lane)
             If the car is not the first in the lane and it has not yet passed the intersection,
-            a check is performed regarding the distance from the next car (keeping a buffer for esthetics)
+            a check is performed regarding the distance from the next car (keeping a buffer for esthetics).
+            Cars of a lane are aligned, their distance is measured along the axis of the lane
         """
-        if (self.next_car != False) and (not self.pass_intersection) and (Point(self.next_car.rect.center).dist(Point(self.rect.center))<= 1.18*self.height):
-            self.stop()
+        if (self.next_car != False) and (not self.pass_intersection):
+            if self.vertical:
+                distance = abs(self.next_car.rect.centery - self.rect.centery)
+            else:
+                distance = abs(self.next_car.rect.centerx - self.rect.centerx)
+            if distance <= self.stop_distance:
+                self.stop()
 
     def move(self):
         """ Main function applied to each car on the screen to displace it (if it is moving)
         """
         if self.driving:
-            self.pos = Point(self.rect.center) +  Point(self.moving)*self.speed
-            self.rect.center = (self.pos.x, self.pos.y)
+            self.rect.move_ip(self.step_x, self.step_y)
             # every time the car moves, waiting time is reset to 0
-            self.reset_waiting()
+            if self.waiting_time:
+                self.reset_waiting()
             # if not yet passed the intersection, we check (once) if this has happened after the movement
             if (not self.pass_intersection) and (self.is_at_intersection()):
                 self.pass_intersection = True
@@ -213,17 +361,23 @@ class Car(pygame.sprite.Sprite):
     def stop(self):
         """ Method setting driving to False if car is steady
         """
+        if self.driving and self.waiting is not None:
+            self.waiting.change_driving(self.direction, False)
         self.driving = False
 
     def go(self):
-        """ Method setting driving to False if a red/yellow light is present
+        """ Method setting driving to True if the car is free to go
         """
+        if not self.driving and self.waiting is not None:
+            self.waiting.change_driving(self.direction, True)
         self.driving = True
         
     def reset_waiting(self):
         """ Method called inside self.move() to reset the waiting time to 0 every time
             the car moves
         """
+        if self.waiting_time and self.waiting is not None:
+            self.waiting.change_time(self.waiting_time, 0)
         self.waiting_time = 0
     
     def update_waiting(self):
@@ -231,6 +385,8 @@ class Car(pygame.sprite.Sprite):
             remaining steady)
         """
         if not self.driving:
+            if self.waiting is not None:
+                self.waiting.change_time(self.waiting_time, self.waiting_time + 1)
             self.waiting_time += 1
 
     def draw(self, surface: pygame.display):
@@ -282,6 +438,125 @@ class Car(pygame.sprite.Sprite):
         return not pygame.Rect.colliderect(self.rect, screen_rect)
     
 
+class Lane:
+    """ Traffic lane, storing its cars in the order in which they drive (cars never overtake each other in a lane).
+        Cars that are beyond the stopping area (departing) are separated from the ones still approaching it,
+        so that only the first approaching cars have to be checked against the traffic light
+    """
+
+    def __init__(self, direction, rect):
+        """ Initialization
+
+        Args:
+            direction (str): direction of the cars in the lane
+            rect (pygame.Rect): rect of a car entering the lane
+        """
+        self.direction = direction
+        # area covered by the cars of the lane (on screen and in the margins before leaving it)
+        if direction in ["north", "south"]:
+            self.strip = Rect(rect.x, -Setup.HEIGHT, rect.width, 3*Setup.HEIGHT)
+        else:
+            self.strip = Rect(-Setup.WIDTH, rect.y, 3*Setup.WIDTH, rect.height)
+        # smallest rect containing the conflict zones with the lanes crossing this one (None if there are none)
+        self.area = None
+        # first car is the closest to the exit of the screen
+        self.departing = deque()
+        # first car is the closest to the stopping area, last car is the last one that entered the screen
+        self.approaching = deque()
+
+    def __len__(self):
+        return len(self.departing) + len(self.approaching)
+
+    def last(self):
+        """ Last car of the lane (the one behind which a new car enters)
+
+        Returns:
+            Car: last car, False if the lane is empty
+        """
+        if self.approaching:
+            return self.approaching[-1]
+        if self.departing:
+            return self.departing[-1]
+        return False
+
+    def append(self, car):
+        """ Adds a new car at the end of the lane
+        """
+        self.approaching.append(car)
+
+    def update_departing(self):
+        """ Moves the cars that went beyond the stopping area to the departing queue. Those cars have passed the
+            intersection, so that they keep driving until they leave the screen
+        """
+        while self.approaching and self.approaching[0].pass_intersection and not self.approaching[0].is_at_light():
+            car = self.approaching.popleft()
+            car.go()
+            self.departing.append(car)
+
+    def cars_at_light(self):
+        """ Generator over the cars colliding with the stopping area (the first approaching ones)
+        """
+        for car in self.approaching:
+            if not car.is_at_light():
+                return
+            yield car
+
+    def add_conflict(self, zone):
+        """ Extends the conflict area of the lane with the zone in which it crosses another lane
+        """
+        self.area = zone if self.area is None else self.area.union(zone)
+
+    def _side(self, car):
+        """ Position of a car of the lane with respect to its conflict area
+
+        Returns:
+            int: 0 if the car overlaps the area, -1 if it has not reached it yet, 1 if it is beyond it
+        """
+        if car.rect.colliderect(self.area):
+            return 0
+        move_x, move_y = MOVEMENTS[self.direction]
+        ahead = (car.rect.centerx - self.area.centerx)*move_x + (car.rect.centery - self.area.centery)*move_y
+        return 1 if ahead > 0 else -1
+
+    def cars_in_area(self):
+        """ Cars of the lane overlapping its conflict area. Cars are ordered, so that the search starts from the
+            last departing and first approaching cars and stops as soon as a car is away from the area
+
+        Returns:
+            list: cars overlapping the conflict area
+        """
+        res = []
+        if self.area is None:
+            return res
+        for car in reversed(self.departing):
+            side = self._side(car)
+            if side > 0:
+                break
+            if side == 0:
+                res.append(car)
+        for car in self.approaching:
+            side = self._side(car)
+            if side < 0:
+                break
+            if side == 0:
+                res.append(car)
+        return res
+
+    def pop_off_screen(self):
+        """ Removes the first cars of the lane as long as they are off screen
+
+        Returns:
+            list: cars that left the screen
+        """
+        res = []
+        for queue in [self.departing, self.approaching]:
+            while queue and queue[0].is_off_screen():
+                res.append(queue.popleft())
+            if queue:
+                break
+        return res
+
+
 class Game:
     """ Game class to track and take care of all the dynamics
     """
@@ -296,8 +571,17 @@ class Game:
         self.cars_dict = {dir: pygame.sprite.Group() for dir in dirs} 
         # dictionary with a bool for each traffic light to determine the color
         self.lights_dict = {dir: True for dir in dirs} 
-        # dictionary used to store the last car in each lane (to assign to each car its .next car in an optimized manner)
-        self.cars_dict_last = defaultdict()
+        # dictionary storing the traffic lanes of each direction, identified by (direction, coordinate of the lane)
+        self.lanes = {}
+        # pairs of lanes of different directions crossing each other, the only ones in which cars can crash
+        self.conflicts = []
+        # manual switches of the lights (see .switch_light()) skip the yellow lights
+        self.lights_switched = False
+        # set when cars moved without releasing the cars stopped behind them (see .move_at_yellow() and .restore()),
+        # all the stopped cars are released at the next .check_lights() (and stopped again behind other cars)
+        self.release_all = False
+        # statistics of the waiting cars, updated by the cars when they stop, go or wait
+        self.waiting = WaitingCars(dirs)
         self.dirs = dirs
         self.number_cars = 0
         self.score = 0
@@ -325,34 +609,57 @@ class Game:
                 for car in cars:
                     fun(car)       
         
-    def add_car(self, dir):
+    def get_lane(self, dir, pos):
+        """ Access to the traffic lane of a car, created the first time it is needed
+
+        Args:
+            dir (str): direction of the car
+            pos (Point): initial position of the car
+
+        Returns:
+            Lane: traffic lane
+        """
+        # same road lane
+        if dir in ["north", "south"]:
+            comp = pos.x
+        else:
+            comp = pos.y
+        if (dir, comp) not in self.lanes:
+            rect = pygame.Rect((0, 0), car_size(dir))
+            rect.center = pos.get()
+            lane = Lane(dir, rect)
+            # conflict zones with the existing lanes, where the areas covered by the two lanes intersect
+            for other in self.lanes.values():
+                zone = lane.strip.clip(other.strip)
+                if other.direction != dir and zone.width > 0 and zone.height > 0:
+                    lane.add_conflict(zone)
+                    other.add_conflict(zone)
+                    self.conflicts.append((lane, other))
+            self.lanes[(dir, comp)] = lane
+        return self.lanes[(dir, comp)]
+
+    def add_car(self, dir, side, image):
         """ Method used to add a new car in a specified direction
-            If first checkes if an additional car can be added (lanes not full), then it sets
-            the car that was previously the last in the lane as the next car for the new one,
-            and finally stores the new car as the last in a lane
+            The car is added only if its traffic lane is not full.
+            The car that was previously the last in the lane becomes the next car for the new one
 
         Args:
             dir (str): direction for which we want a new car
+            side (int): traffic lane of the car, index of its nudge in NUDGES (drawn by the environment)
+            image (str): file name of the image of the car in IMAGE_DIR (drawn by the environment)
         """
-        # check if new car would not overlap with any of the existing ones (lane is full)
-        if not self.can_add_car(dir):
+        pos = Point(initial_position(dir, NUDGES[side]))
+        # check if new car would not overlap with the last one of its lane (lane is full)
+        if not self.can_add_car(dir, pos):
             return
-        next_car = Car(direction=dir)
+        next_car = Car(direction=dir, pos=pos, waiting=self.waiting, image=image)
+        lane = self.get_lane(dir, pos)
         
-        # same road lane
-        if dir in ["north", "south"]:
-            comp = next_car.pos.x
-        else:
-            comp = next_car.pos.y
-            
-        # get car that was previously the last one in the given lane
-        prec_car = self.cars_dict_last.get((dir, comp), False)
-        # sets it as the next car of the new car
-        next_car.next_car = prec_car
+        # sets the car that was previously the last one in the lane as the next car of the new car
+        next_car.next_car = lane.last()
         # stores the new car as the last one in the lane
+        lane.append(next_car)
         self.cars_dict[dir].add([next_car])
-        
-        self.cars_dict_last[(dir, comp)] = next_car                
         self.number_cars += 1
         
     def set_light(self, dir, value):
@@ -373,6 +680,7 @@ class Game:
             dir (str): specified direction to identify the corresponding traffic light
         """
         self.lights_dict[dir] = not self.lights_dict[dir]
+        self.lights_switched = True
 
     def get_lights(self):
         """ Get method to access the dictionary of light values (storing all the colors active at the moment)
@@ -384,16 +692,31 @@ class Game:
     
     def max_wait_time(self):
         """ Method to access the maximum waiting time among the waiting cars
-            as those not moving have a waiting time equal to 0
+            as those not moving have a waiting time equal to 0 (tracked by self.waiting)
 
         Returns:
             int: maximum waiting time across all the cars on the screen
         """
-        res = 0
-        for _, cars in self.cars_dict.items():
-            for car in cars:
-                res = max(res, car.waiting_time)
-        return res
+        return self.waiting.max_time
+
+    def waiting_cars(self):
+        """ Method to access the number of cars that are not driving (waiting at a light or behind another car),
+            counted incrementally as cars stop, go or leave the screen
+
+        Returns:
+            dict: number of waiting cars for each direction
+        """
+        return self.waiting.counts
+
+    def waiting_stats(self):
+        """ Number of waiting cars and maximum waiting time at once, as needed by the environment at every frame
+
+        Returns:
+            list of int: number of waiting cars for each direction, in the order of dirs
+            int: maximum waiting time across all the cars on the screen
+        """
+        counts = self.waiting.counts
+        return [counts[dir] for dir in self.dirs], self.waiting.max_time
 
     def draw_cars(self, surface):
         """ Wrapper function used to draw all the cars on screen
@@ -407,13 +730,32 @@ class Game:
 
     def check_lights(self):
         """ Function that checks if the lights are red or green and updates movement of each car
-        """
-        for dir, green in self.lights_dict.items():
-            if green: # Light is green
-                self.apply_to_each_car(Car.go, dir=dir)
-            if not green: # Light is red
-                self.apply_to_each_car(Car.should_stop, dir=dir)
-                
+            Only the cars colliding with the stopping area are checked against the light, the other
+            approaching cars keep their state unless the car ahead of them started moving or left the lane
+            (they are stopped behind other cars in .stop_behind_car()) and the departing ones are always driving
+        """
+        for lane in self.lanes.values():
+            lane.update_departing()
+            # the first approaching cars (in the stopping area) stop with a red light and go with a green one
+            green = self.lights_dict[lane.direction]
+            # whether the car ahead moved in the last frame (the first approaching car has no car ahead in the lane)
+            moved, at_light = True, 0
+            for car in lane.cars_at_light():
+                moved, at_light = car.driving, at_light + 1
+                if green:
+                    car.go()
+                else:
+                    car.stop()
+            # a car stopped behind another one is released only when the car ahead of it moved (or left the lane),
+            # it stops again if it is still too close to it
+            for car in islice(lane.approaching, at_light, None):
+                if car.driving:
+                    moved = True
+                elif moved or self.release_all:
+                    car.go()
+                    moved = False
+        self.release_all = False
+
     def move_at_yellow(self):
         """ Method used to move the cars that are still driving and not colliding with the corresponding
             stopping area (dependent on the car's direction), that is used to clear the intersection at any
@@ -423,6 +765,7 @@ class Game:
             for car in cars:
                 if not Setup.STOP_ZONES[dir].collidepoint(car.rect.center):
                     car.move()
+        self.release_all = True
                         
                 
     def check_at_yellow(self, yellows):
@@ -443,11 +786,30 @@ class Game:
         return False
 
 
+    def clear_yellow(self, yellows):
+        """ Lets the cars of the directions turning red clear the intersection: cars keep moving (see .move_at_yellow())
+            as long as some of those cars are at the intersection, at most for Setup.YELLOW_MAX_FRAMES frames
+
+        Args:
+            yellows (list of str): list of directions that switched from green to red
+
+        Returns:
+            int: number of frames of yellow light
+        """
+        for frames in range(Setup.YELLOW_MAX_FRAMES):
+            if not self.check_at_yellow(yellows):
+                return frames
+            self.move_at_yellow()
+            self.stop_behind_car()
+            self.update_score()
+        return Setup.YELLOW_MAX_FRAMES
+
     def stop_behind_car(self):
         """ Function that checks for every car on the screen whether it should stop behind another car.
         """       
-        for dir, cars in self.cars_dict.items():
-            for car in cars:
+        for lane in self.lanes.values():
+            # departing cars have passed the intersection, they never stop behind other cars
+            for car in lane.approaching:
                 if car.driving:
                     car.check_next_car()
         
@@ -459,49 +821,60 @@ class Game:
             if not light_green:
                 self.apply_to_each_car(Car.update_waiting, dir=direct)
                          
+    def lights_can_conflict(self):
+        """ Whether the current lights let cars of crossing roads drive into the intersection.
+            If only one road has green lights, the cars of the other one were cleared by the yellow lights and
+            stop before the intersection, so that no crash can happen (this does not hold after manual switches)
+
+        Returns:
+            bool: whether cars of the two roads can be at the intersection at the same time
+        """
+        roads = {dir in ["north", "south"] for dir, light_green in self.lights_dict.items() if light_green}
+        return self.lights_switched or len(roads) > 1
+
     def check_crash(self):
-        """ Function that checks if two cars belonging to different directions are colliding.
-            The same condition with respect to a given traffic lane is in fact implemented by
-            .check_next_car()
+        """ Function that checks if two cars belonging to different directions are colliding, one of them
+            being at the intersection. The same condition with respect to a given traffic lane is in fact
+            implemented by .check_next_car()
+            Two cars can only collide in the conflict zone of their lanes, so that only the cars overlapping
+            the conflict areas are compared, for the pairs of crossing lanes
 
         Returns:
             bool: whether a collision has happened on the screen or not
         """
-        for dir, car_group in self.cars_dict.items():
-            if len(car_group)>0:
-                all_rest = pygame.sprite.Group()
-                others_to_add = [v.sprites() for k, v in self.cars_dict.items() if (k!=dir) and (len(v)>0)]
-                others_to_add = [v for k in others_to_add for v in k if v.is_at_intersection()]
-                all_rest.add(*[others_to_add])
-                collisions = pygame.sprite.groupcollide(car_group, all_rest, False, False)
-                
-                if len(collisions)>0:
-                    return True
+        if not self.lights_can_conflict():
+            return False
+        cars = {}
+        for lane, other in self.conflicts:
+            for l in [lane, other]:
+                if l not in cars:
+                    cars[l] = l.cars_in_area()
+            for car in cars[lane]:
+                for other_car in cars[other]:
+                    if car.rect.colliderect(other_car.rect) and (car.is_at_intersection() or other_car.is_at_intersection()):
+                        return True
         return False
     
 
-    def can_add_car(self, dir):
-        """ Function to verify whether a new car can be added or not (lane already full)
+    def can_add_car(self, dir, pos):
+        """ Function to verify whether a new car can be added or not (lane already full), only comparing it
+            with the last car of its lane
 
         Args:
             dir (str): specified direction of the new car we want to add (randomly sampled according to the given
                        probabilities)
+            pos (Point): initial position of the new car (identifying its lane)
 
         Returns:
-            bool: whether the new car is colliding with any of the already existing cars on the lane or not
+            bool: whether the new car is colliding with the last car of the lane or not
         """
-        car_group = self.cars_dict[dir]
-        car = Car(direction=dir)
-        
-        # same road lane
-        if dir in ["north", "south"]:
-            comp = car.pos.x
-        else:
-            comp = car.pos.y
-            
-        prec_car = self.cars_dict_last.get((dir, comp), False)       
-         
-        return (True if not prec_car else not car.rect.colliderect(prec_car.rect))    # pygame.sprite.spritecollide(car, car_group, dokill=False )
+        prec_car = self.get_lane(dir, pos).last()
+        if not prec_car:
+            return True
+        # rect of the new car, without creating it
+        rect = pygame.Rect((0, 0), car_size(dir))
+        rect.center = pos.get()
+        return not rect.colliderect(prec_car.rect)
 
 
     def update_score(self):
@@ -513,11 +886,12 @@ class Game:
         Returns:
             int: updated score to be included in the information dictionary of the environment
         """
-        for dir, car_group in self.cars_dict.items():
-            for car in car_group:
-                if car.is_off_screen():
-                    car_group.remove(car)
-                    self.score += 1
+        # only the first cars of each lane can leave the screen
+        for lane in self.lanes.values():
+            for car in lane.pop_off_screen():
+                self.cars_dict[lane.direction].remove(car)
+                self.waiting.remove(car)
+                self.score += 1
 
         return self.score
     
@@ -552,3 +926,68 @@ class Game:
                 return True
         return False
 
+    def reset_score(self):
+        """ Sets the score back to 0, the cars on the screen are counted as the only cars added
+        """
+        self.number_cars -= self.score
+        self.score = 0
+
+    def snapshot(self):
+        """ State of the game as an immutable value (no sprite nor surface), that can be restored any number of times
+            (see .restore()), for instance to branch simulations
+
+        Returns:
+            GameState: cars, lanes, lights and scores
+        """
+        index = {}
+        cars = []
+        for _, group in self.cars_dict.items():
+            for car in group:
+                index[car] = len(cars)
+                cars.append((car.direction, car.rect.center, car.image_name, car.driving, car.waiting_time,
+                             car.pass_intersection))
+        lanes = tuple((key, tuple(index[car] for car in lane.departing), tuple(index[car] for car in lane.approaching))
+                      for key, lane in self.lanes.items())
+        return GameState(tuple(cars), lanes, tuple(self.lights_dict.items()), self.lights_switched, self.score,
+                         self.number_cars)
+
+    def restore(self, state):
+        """ Sets the game back to a state returned by .snapshot(), the cars are created again.
+            The next car of each car is the one in front of it in its lane (a car whose next car left the screen has
+            passed the intersection, it does not look at it anymore)
+
+        Args:
+            state (GameState): state of a game with the same directions
+        """
+        self.waiting = WaitingCars(self.dirs)
+        self.release_all = True
+        cars = []
+        for direction, center, image, driving, waiting_time, passed in state.cars:
+            car = Car(direction=direction, pos=Point(center), waiting=self.waiting, image=image)
+            car.pass_intersection = passed
+            if not driving:
+                car.stop()
+            self.waiting.change_time(0, waiting_time)
+            car.waiting_time = waiting_time
+            cars.append(car)
+        for dir, group in self.cars_dict.items():
+            group.empty()
+            group.add([car for car in cars if car.direction == dir])
+
+        for lane in self.lanes.values():
+            lane.departing.clear()
+            lane.approaching.clear()
+        for (dir, comp), departing, approaching in state.lanes:
+            lane = self.get_lane(dir, Point((comp, 0) if dir in ["north", "south"] else (0, comp)))
+            lane.departing.extend(cars[i] for i in departing)
+            lane.approaching.extend(cars[i] for i in approaching)
+            next_car = False
+            for car in [*lane.departing, *lane.approaching]:
+                car.next_car = next_car
+                next_car = car
+
+        self.lights_dict.update(state.lights)
+        self.lights_switched = state.lights_switched
+        self.score = state.score
+        self.number_cars = state.number_cars
+
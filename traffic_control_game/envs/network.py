@@ -0,0 +1,199 @@
+import numpy as np
+from collections import namedtuple
+from traffic_control_game.envs.headless import BatchGame, SCREEN
+
+
+# position of the next junction for each direction of the cars on a grid (row and column offsets), cars of a
+# direction keep it at every junction ("north" cars come from the north and drive south, see MOVEMENTS)
+GRID_MOVES = {"north": (1, 0), "south": (-1, 0), "east": (0, -1), "west": (0, 1)}
+# state of a NetworkGame (see NetworkGame.snapshot): state of the arrays, cars waiting to enter their lane and cars
+# handed to other shards
+NetworkState = namedtuple("NetworkState", ["batch", "pending", "outgoing"])
+
+
+class Network:
+    """ Road network of intersections: each car leaving a junction in a direction is handed to the approach of the
+        same direction of the downstream junction, if any, and leaves the network otherwise.
+        Approaches without upstream junction are the entries of the network, where new cars arrive
+    """
+
+    def __init__(self, n_junctions, links, dirs):
+        """ Initialization
+
+        Args:
+            n_junctions (int): number of intersections
+            links (dict): downstream junction of each (junction, direction) pair linked to another junction
+            dirs (list of str): list of possible directions, passed by the environment
+        """
+        self.n_junctions = n_junctions
+        self.dirs = dirs
+        # downstream and upstream junction of each junction and direction (-1 for exits and entries of the network)
+        self.downstream = np.full((n_junctions, len(dirs)), -1, dtype=np.int64)
+        self.upstream = np.full((n_junctions, len(dirs)), -1, dtype=np.int64)
+        for (junction, dir), next_junction in links.items():
+            dir_index = dirs.index(dir)
+            assert 0 <= junction < n_junctions and 0 <= next_junction < n_junctions, "unknown junction in links"
+            assert self.upstream[next_junction, dir_index] == -1, f"two roads lead to the {dir} approach of {next_junction}"
+            self.downstream[junction, dir_index] = next_junction
+            self.upstream[next_junction, dir_index] = junction
+
+    @classmethod
+    def grid(cls, rows, cols, dirs):
+        """ Grid of rows x cols intersections (junction r*cols + c at row r and column c, row 0 at the top),
+            connected to their neighbours in the four directions
+
+        Args:
+            rows (int): number of rows
+            cols (int): number of columns
+            dirs (list of str): list of possible directions, passed by the environment
+
+        Returns:
+            Network: grid network
+        """
+        links = {}
+        for row in range(rows):
+            for col in range(cols):
+                for dir in dirs:
+                    next_row, next_col = row + GRID_MOVES[dir][0], col + GRID_MOVES[dir][1]
+                    if 0 <= next_row < rows and 0 <= next_col < cols:
+                        links[(row*cols + col, dir)] = next_row*cols + next_col
+        return cls(rows*cols, links, dirs)
+
+    def entries(self):
+        """ Approaches without upstream junction, where new cars arrive
+
+        Returns:
+            np.array: junction of each entry
+            np.array: direction (index in dirs) of each entry
+        """
+        return np.nonzero(self.upstream == -1)
+
+
+class NetworkGame(BatchGame):
+    """ BatchGame in which the games are the junctions of a network: the cars leaving the screen of a junction are
+        handed to the lane with the same direction and traffic lane of the downstream junction instead of being
+        counted in its score (only the cars leaving the network are counted, at the junction they leave).
+        A handed car enters its new lane as soon as it has room, in the order in which the cars arrived.
+        All the updates of a frame only depend on the cars on the screens and waiting to enter, not on the number
+        of junctions
+    """
+
+    def __init__(self, network, junctions=None, jit=True):
+        """ Initialization
+
+        Args:
+            network (Network): intersections and roads between them
+            junctions (np.array, optional): junctions simulated by this game (a shard of the network), the cars leaving
+                                            them for other junctions are collected in .outgoing. Defaults to all.
+            jit (bool, optional): advance the cars with the compiled kernel if Numba is installed. Defaults to True.
+        """
+        self.junctions = np.arange(network.n_junctions) if junctions is None else np.asarray(junctions)
+        super().__init__(network.dirs, n_games=len(self.junctions), jit=jit)
+        self.network = network
+        # game of each junction of the network (-1 for the junctions of other shards)
+        self.local_games = np.full(network.n_junctions, -1, dtype=np.int64)
+        self.local_games[self.junctions] = np.arange(self.n_games)
+        # index of the downstream lane of each lane: in this game, or in the whole network (global index
+        # junction*n_lanes + lane) for the lanes leading to other shards, -1 otherwise. The traffic lane of a car
+        # is the same at every junction (lane l is the lane of direction dirs[l//2], see lane_geometry)
+        lanes = np.arange(self.n_games*self.n_lanes)
+        downstream = network.downstream[self.junctions[lanes // self.n_lanes], (lanes % self.n_lanes) // 2]
+        games = np.where(downstream >= 0, self.local_games[downstream], -1)
+        self.downstream_lanes = np.where(games >= 0, games*self.n_lanes + lanes % self.n_lanes, -1)
+        self.remote_lanes = np.where((downstream >= 0) & (games < 0), downstream*self.n_lanes + lanes % self.n_lanes, -1)
+        # lanes of the handed cars waiting to enter, in order of arrival, and global lanes of the cars handed
+        # to other shards (see .receive())
+        self.pending = np.empty(0, dtype=np.int64)
+        self.outgoing = np.empty(0, dtype=np.int64)
+
+    def reset_games(self, games):
+        """ Removes all cars of the given games (and the cars waiting to enter them) and sets them back to their
+            initial state
+
+        Args:
+            games (np.array): boolean mask over the games
+        """
+        super().reset_games(games)
+        self.pending = self.pending[~games[self.pending // self.n_lanes]]
+
+    def enter_cars(self, lanes=None):
+        """ Adds the first waiting car of each lane with pending cars, and a new car in each of the given lanes,
+            if the lane has room for it
+
+        Args:
+            lanes (np.array, optional): index of the lanes of new cars (entries of the network), without duplicates.
+                                        Defaults to no new car.
+        """
+        # first waiting car of each lane, the others wait behind it
+        pending, first = np.unique(self.pending, return_index=True)
+        if lanes is not None:
+            pending = np.concatenate((pending, lanes))
+        entering = self.can_add_cars(pending)
+        self.add_cars(pending[entering])
+        if len(first) > 0:
+            self.pending = np.delete(self.pending, first[entering[:len(first)]])
+
+    def update_scores(self):
+        """ Removes the cars that left the screen: the ones of a lane linked to another junction wait to enter it
+            (or are collected in .outgoing if it belongs to another shard), the score of the game is incremented
+            for each of the others
+
+        Returns:
+            np.array: updated scores
+        """
+        on_screen = self._between(SCREEN)
+        if not on_screen.all():
+            lanes = self.lane[~on_screen]
+            downstream, remote = self.downstream_lanes[lanes], self.remote_lanes[lanes]
+            self.pending = np.concatenate((self.pending, downstream[downstream >= 0]))
+            self.outgoing = np.concatenate((self.outgoing, remote[remote >= 0]))
+            leaving = (downstream < 0) & (remote < 0)
+            np.add.at(self.scores, lanes[leaving] // self.n_lanes, 1)
+            self._keep(on_screen)
+        return self.scores
+
+    def receive(self, lanes):
+        """ Cars handed by other shards, waiting to enter their lane
+
+        Args:
+            lanes (np.array): lanes of the cars in the whole network (junction*n_lanes + lane), of junctions
+                              of this game
+        """
+        games = self.local_games[lanes // self.n_lanes]
+        self.pending = np.concatenate((self.pending, games*self.n_lanes + lanes % self.n_lanes))
+
+    def frame(self, lanes, max_wait_time):
+        """ Computes one frame of all the junctions: handed and new cars enter their lane, cars move, stop at red
+            lights and behind other cars, and leave the screens
+
+        Args:
+            lanes (np.array): index of the lanes of new cars (entries of the network), without duplicates
+            max_wait_time (int): upper bound on waiting time
+
+        Returns:
+            bool: whether the episode is over (crash or a car waiting more than max_wait_time at any junction)
+        """
+        self.enter_cars(lanes)
+        self.advance()
+        self.update_scores()
+        return len(self.waiting_time) > 0 and bool(self.waiting_time.max() > max_wait_time or
+                                                   len(self.crashed_games()) > 0)
+
+    def snapshot(self):
+        """ State of the network, that can be restored any number of times (see .restore())
+
+        Returns:
+            NetworkState: arrays of the cars and of the games, cars waiting to enter their lane and cars handed
+                          to other shards
+        """
+        return NetworkState(super().snapshot(), self.pending.copy(), self.outgoing.copy())
+
+    def restore(self, state):
+        """ Sets the network back to a state returned by .snapshot()
+
+        Args:
+            state (NetworkState): state of a NetworkGame with the same network and junctions
+        """
+        super().restore(state.batch)
+        self.pending = state.pending.copy()
+        self.outgoing = state.outgoing.copy()
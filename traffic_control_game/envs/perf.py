@@ -0,0 +1,86 @@
+from time import perf_counter_ns
+
+
+class PerfStats:
+    """ Timings of the stages of the environment steps (in nanoseconds) and counters of the simulated frames and cars.
+        Stages are measured by wrapping the methods that implement them (see .wrap()), so that nothing is measured
+        (and nothing is paid) when the statistics are disabled. Timings are exclusive: when a timed method calls
+        another timed method (e.g. the yellow lights moving the cars), the time of the inner call only counts
+        for the inner stage
+    """
+
+    # stages of a step, in the order in which they happen
+    STAGES = ["yellow", "update_waiting", "arrivals", "add_car", "move_cars", "frames_to_event", "check_lights",
+              "stop_behind_car", "update_score", "get_obs", "check_crash", "render"]
+    COUNTS = ["steps", "frames", "car_frames"]
+
+    def __init__(self):
+        # timings and counters of the current step, and cumulated since the creation of the environment
+        self.step = dict.fromkeys(self.STAGES + self.COUNTS, 0)
+        self.total = dict.fromkeys(self.STAGES + self.COUNTS, 0)
+        # time spent in the timed calls nested in the running one
+        self.inner = 0
+
+    def timed(self, stage, fun):
+        """ Wraps a function so that its (exclusive) running time is added to the given stage
+
+        Args:
+            stage (str): one of PerfStats.STAGES
+            fun (callable): function to time
+
+        Returns:
+            callable: function with the same signature and results
+        """
+        step = self.step
+
+        def timed_fun(*args, **kwargs):
+            outer, self.inner = self.inner, 0
+            start = perf_counter_ns()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                step[stage] += elapsed - self.inner
+                self.inner = outer + elapsed
+        return timed_fun
+
+    def wrap(self, obj, stages):
+        """ Replaces methods of an object by timed versions (as instance attributes)
+
+        Args:
+            obj (object): game or environment
+            stages (dict): stage of each method name, methods that do not exist are ignored
+        """
+        for name, stage in stages.items():
+            if hasattr(obj, name):
+                setattr(obj, name, self.timed(stage, getattr(obj, name)))
+
+    def count(self, frames, cars):
+        """ Counts simulated frames. Frames computed at once (fast-forward, yellow lights without rendering)
+            are counted with the cars on the screen at their end
+
+        Args:
+            frames (int): number of frames
+            cars (int): number of cars on the screen during these frames
+        """
+        self.step["frames"] += frames
+        self.step["car_frames"] += frames*cars
+
+    def start_step(self):
+        """ Adds the statistics of the previous step to the totals and starts a new step
+        """
+        for key, value in self.step.items():
+            self.total[key] += value
+            self.step[key] = 0
+        self.step["steps"] = 1
+
+    def get(self):
+        """ Access to the statistics
+
+        Returns:
+            dict: dictionary containing
+                - "step": timings (ns) and counters of the last step
+                - "total": timings (ns) and counters cumulated over all the steps (including the last one)
+        """
+        return {"step": dict(self.step),
+                "total": {key: value + self.step[key] for key, value in self.total.items()}}